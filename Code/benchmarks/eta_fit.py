@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+# eta_fit.py
+# checks the incremental ETA fit against the batch np.polyfit it replaced and times both,
+# run from the Code directory with: python3 -m benchmarks.eta_fit
+import sys
+import time
+import numpy as np
+
+from lib.eta import EtaEstimator, batch_coefficients
+
+# largest deviation between both fitted curves in % relative humidity
+TOLERANCE = 1e-6
+
+def drying_curve(samples, delay, seed=0):
+    # humidity decaying towards 4% with sensor noise
+    random = np.random.RandomState(seed)
+    seconds = np.arange(samples) * delay
+    humidity = 4 + 40 * np.exp(-seconds / 5400) + random.normal(0, 0.3, samples)
+    return seconds, humidity
+
+def check(samples, delay):
+    seconds, humidity = drying_curve(samples, delay)
+
+    estimator = EtaEstimator()
+    start = time.perf_counter()
+    for t, h in zip(seconds, humidity):
+        estimator.add_sample(t, h)
+    streaming = estimator.coefficients()
+    update_time = (time.perf_counter() - start) / samples
+
+    start = time.perf_counter()
+    batch = batch_coefficients(seconds, humidity)
+    batch_time = time.perf_counter() - start
+
+    deviation = np.max(np.abs(np.polyval(streaming, seconds) - np.polyval(batch, seconds)))
+    print('{:>8d} samples: incremental {:6.1f}us/sample, batch {:8.2f}ms/fit, max deviation {:.2e}%'.format(
+        samples, update_time * 1e6, batch_time * 1e3, deviation))
+    return deviation <= TOLERANCE
+
+def main():
+    results = [check(samples, delay) for samples, delay in ((1000, 1), (10000, 1), (216000, 0.1))]
+    if not all(results):
+        print('incremental fit deviates from the batch fit')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
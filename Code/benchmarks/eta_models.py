@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+# eta_models.py
+# replays recorded runs through every ETA model and scores the predictions and the CPU time per update,
+# run from the Code directory with: python3 -m benchmarks.eta_models [recordings...]
+# Recordings are CSV logs as read by mocks.DHT22SampleVals or run logs, without any a simulated process is used.
+import argparse
+import os
+import time
+import numpy as np
+
+from lib.eta import MODELS
+from lib.runlog import load_run
+from lib.control import PidController, TimeProportionalRelay, HeaterController
+from lib.mocks import DryerPlant
+
+def load_recording(path):
+    # seconds since the start and humidity of a recording
+    if path.endswith('.run'):
+        records = load_run(path)
+        return (records['timestamp'] - records['timestamp'][0]) / 1e6, records['humidity'].astype(np.float64)
+    from lib.mocks import DHT22SampleVals
+    data = DHT22SampleVals(path).data
+    seconds = (data['Time'] - data['Time'][0]).dt.total_seconds().values
+    return seconds, data['Humidity'].values.astype(np.float64)
+
+def simulate_recording(seed, sensor_interval=2):
+    # a heater controlled process on the simulated chamber with a random load and sensor noise
+    random = np.random.RandomState(seed)
+    plant = DryerPlant(ambient=random.uniform(15, 25), heater_rise=random.uniform(60, 90),
+                       time_constant=random.uniform(600, 1500), drying_time=random.uniform(60000, 180000))
+    heater = [False]
+    control = HeaterController(PidController(72), TimeProportionalRelay(lambda state: heater.__setitem__(0, state)))
+    seconds, humidity = [], []
+    for now in range(6 * 3600):
+        if now % sensor_interval == 0:
+            h, t = plant.read()
+            control.measure(now, t)
+            seconds.append(now)
+            humidity.append(h + random.normal(0, 0.2))
+        control.update(now)
+        plant.step(1, heater[0])
+    return np.array(seconds, dtype=np.float64), np.array(humidity)
+
+def score(model_class, seconds, humidity, target, evaluations):
+    # prediction errors in minutes at evenly spaced points before the target is reached
+    finish = seconds[np.argmax(humidity <= target)]
+    checkpoints = set(np.searchsorted(seconds, np.linspace(0, finish, evaluations + 2)[1:-1]).tolist())
+    model = model_class()
+    errors = {}
+    update_time = eta_time = 0
+    for num in range(len(seconds)):
+        start = time.perf_counter()
+        model.add_sample(seconds[num], humidity[num])
+        update_time += time.perf_counter() - start
+        if num in checkpoints:
+            start = time.perf_counter()
+            eta = model.eta(target)
+            eta_time += time.perf_counter() - start
+            errors[seconds[num] / finish] = None if eta is None else (eta - finish) / 60
+    return errors, update_time / len(seconds), eta_time / max(len(checkpoints), 1)
+
+def main():
+    parser = argparse.ArgumentParser(description='prediction error and CPU time of the ETA models on recorded runs')
+    parser.add_argument('recordings', nargs='*', help='CSV logs or run logs')
+    parser.add_argument('--simulated', type=int, default=5, help='simulated runs to use without recordings')
+    parser.add_argument('--evaluations', type=int, default=20, help='predictions to score per run')
+    parser.add_argument('--target', type=float, default=None,
+                        help='target humidity, by default what each run reached at 90%% of its duration')
+    args = parser.parse_args()
+
+    if len(args.recordings) > 0:
+        runs = [(os.path.basename(path), load_recording(path)) for path in args.recordings]
+    else:
+        runs = [('simulated {}'.format(seed), simulate_recording(seed)) for seed in range(args.simulated)]
+
+    print('{:<12} {:<14} {:>9} {:>9} {:>9} {:>9} {:>8} {:>10} {:>9}'.format(
+        'model', 'run', 'err 25%', 'err 50%', 'err 75%', 'mean abs', 'covered', 'update', 'eta'))
+    for name, model_class in sorted(MODELS.items()):
+        all_errors = []
+        for run, (seconds, humidity) in runs:
+            target = args.target if args.target is not None else humidity[int(len(humidity) * 0.9)]
+            if not (humidity <= target).any():
+                print('{:<12} {:<14} never reaches {:.1f}%'.format(name, run, target))
+                continue
+            errors, update_time, eta_time = score(model_class, seconds, humidity, target, args.evaluations)
+            progress = np.array(sorted(errors))
+            predicted = [errors[p] for p in progress if errors[p] is not None]
+            all_errors += predicted
+
+            def error_at(fraction):
+                value = errors[progress[np.argmin(np.abs(progress - fraction))]]
+                return '{:>8.0f}m'.format(value) if value is not None else '{:>9}'.format('-')
+
+            print('{:<12} {:<14} {} {} {} {:>8.0f}m {:>7.0f}% {:>8.1f}us {:>7.1f}us'.format(
+                name, run, error_at(0.25), error_at(0.5), error_at(0.75),
+                np.mean(np.abs(predicted)) if len(predicted) > 0 else np.nan,
+                100 * len(predicted) / len(errors), update_time * 1e6, eta_time * 1e6))
+        if len(all_errors) > 0:
+            print('{:<12} {:<14} {:>39.0f}m'.format(name, 'all runs', np.mean(np.abs(all_errors))))
+
+if __name__ == '__main__':
+    main()
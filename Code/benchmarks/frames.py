@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+# frames.py
+# frame time benchmark of every screen on the headless backend with scripted input,
+# run from the Code directory with: python3 -m benchmarks.frames
+import argparse
+import datetime
+import time
+import tracemalloc
+import numpy as np
+
+from lib import screens
+from lib.app import HeadlessApp
+from lib.timeseries import to_timestamp
+from lib.utils import widget_layers
+
+class DrawTimer:
+    # wraps draw() of the widgets on a screen and collects their draw times by class,
+    # the times of a widget include the widgets it draws itself
+
+    def __init__(self):
+        self.times = {}
+
+    def wrap(self, widget):
+        if widget is None or getattr(widget, 'timed', False):
+            return
+        draw = widget.draw
+        name = type(widget).__name__
+
+        def timed_draw(image):
+            start = time.perf_counter()
+            draw(image)
+            self.times.setdefault(name, []).append(time.perf_counter() - start)
+
+        widget.draw = timed_draw
+        widget.timed = True
+
+    def instrument(self, screen):
+        for widget in (screen.status_bar, screen.widget, screen.dialog, getattr(screen.widget, 'graph', None)):
+            self.wrap(widget)
+
+def run_scenario(name, setup, steps):
+    # setup returns a fresh app showing the screen, every step changes its state before a frame is rendered
+    app = setup()
+    timer = DrawTimer()
+    frame_times = []
+    flushed = []
+
+    for step in steps:
+        with app.lock:
+            step(app)
+            timer.instrument(app.current_screen)
+        flushed_before = app.flushed_bytes
+        start = time.perf_counter()
+        app.render()
+        frame_times.append(time.perf_counter() - start)
+        flushed.append(app.flushed_bytes - flushed_before)
+    finish(app)
+
+    # allocations are traced in a second run, tracing slows down the frames
+    app = setup()
+    peaks = []
+    for step in steps:
+        with app.lock:
+            step(app)
+        tracemalloc.start()
+        app.render()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    finish(app)
+
+    print('{:<18} {:>5d} frames {:8.2f}ms mean {:8.2f}ms max {:9.1f}KB flushed/frame {:9.1f}KB allocated/frame'.format(
+        name, len(frame_times), np.mean(frame_times) * 1e3, np.max(frame_times) * 1e3, np.mean(flushed) / 1024, np.mean(peaks) / 1024))
+    for widget, times in sorted(timer.times.items()):
+        print('    {:<16} {:>5d} draws {:8.2f}ms mean {:8.2f}ms max'.format(widget, len(times), np.mean(times) * 1e3, np.max(times) * 1e3))
+
+def finish(app):
+    # lets the threads of a progress screen run out
+    app.process_running = False
+    app.current_screen.is_waiting = False
+
+def show(screen):
+    def setup():
+        app = HeadlessApp()
+        # the sensor worker isn't running, so a process must not give up on it
+        app.sensor_timeout = float('inf')
+        with app.lock:
+            app.current_screen.switch_screen(screen)
+        app.render()
+        return app
+    return setup
+
+def show_progress(samples):
+    def setup():
+        app = show(screens.ProgressScreen)()
+        # preload the graph with a drying curve of the given length
+        seconds = np.arange(samples) * 0.1
+        timestamps = to_timestamp(datetime.datetime.now()) + (seconds * 1e6).astype(np.int64)
+        humidity = 4 + 40 * np.exp(-seconds / (samples / 10 + 1))
+        temperature = 60 - 20 * np.exp(-seconds / 600)
+        with app.lock:
+            app.current_screen.widget.set_graphdata(timestamps, humidity, temperature)
+        app.render()
+        return app
+    return setup
+
+def new_reading(app):
+    reading = app.current_screen.readings.count
+    app.current_screen.process_reading(datetime.datetime.now(), 10 + np.sin(reading * 0.1), 50 + np.cos(reading * 0.1))
+
+def tick(app):
+    app.current_screen.update_screen()
+
+def main():
+    parser = argparse.ArgumentParser(description='frame times of the screens on the headless backend')
+    parser.add_argument('--frames', type=int, default=50, help='frames per scenario')
+    args = parser.parse_args()
+    frames = args.frames
+
+    run_scenario('StartScreen', show(screens.StartScreen),
+                 [lambda app: None] + [lambda app: app.toggle_theme()] * (frames - 1))
+    run_scenario('MainMenuScreen', show(screens.MainMenuScreen),
+                 ([lambda app: app.current_screen.on_cwturn()] * 4 + [lambda app: app.current_screen.on_ccwturn()] * 4) * (frames // 8))
+    run_scenario('MenuEdit', show(screens.MainMenuScreen),
+                 [lambda app: app.current_screen.on_click()] + [lambda app: app.current_screen.on_cwturn()] * (frames - 1))
+    for samples in (1000, 100000, 1000000):
+        run_scenario('Progress {}'.format(samples), show_progress(samples), [new_reading, tick] * (frames // 2))
+    run_scenario('Dialog', show_progress(1000),
+                 [lambda app: app.current_screen.on_click()] + [lambda app: app.current_screen.on_cwturn()] * (frames - 1))
+    print('widget layers: {} hits, {} misses, {:.1f}KB cached'.format(widget_layers.hits, widget_layers.misses, widget_layers.size / 1024))
+
+if __name__ == '__main__':
+    main()
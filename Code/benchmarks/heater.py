@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+# heater.py
+# drying time and temperature of the heater control strategies on a simulated chamber,
+# run from the Code directory with: python3 -m benchmarks.heater
+import argparse
+import numpy as np
+
+from lib.control import PidController, HysteresisController, TimeProportionalRelay, HeaterController
+from lib.mocks import DryerPlant
+
+class FixedDuty:
+    def __init__(self, duty):
+        self.duty = duty
+
+    def update(self, now, measurement):
+        return self.duty
+
+def simulate(controller, args):
+    # the process of ProgressScreen in simulated time, the sensor is read every sensor_interval seconds
+    plant = DryerPlant()
+    heater = [False]
+    relay = TimeProportionalRelay(lambda state: heater.__setitem__(0, state))
+    control = HeaterController(controller, relay)
+    temperatures = []
+
+    for now in range(int(args.max_runtime * 3600)):
+        if now % args.sensor_interval == 0:
+            humidity, temperature = plant.read()
+            temperatures.append(temperature)
+            control.measure(now, temperature)
+            if temperature > args.max_temperature:
+                return 'Overtemperature!', now, temperatures, relay.switches
+            if len(temperatures) > 10 and humidity <= args.target_humidity:
+                return 'Process Finished', now, temperatures, relay.switches
+        control.update(now)
+        plant.step(1, heater[0])
+    return 'Process Timeout', now, temperatures, relay.switches
+
+def main():
+    parser = argparse.ArgumentParser(description='heater control strategies on a simulated chamber')
+    parser.add_argument('--max-temperature', type=float, default=75)
+    parser.add_argument('--target-humidity', type=float, default=4)
+    parser.add_argument('--max-runtime', type=float, default=6, help='hours')
+    parser.add_argument('--margin', type=float, default=3, help='degrees the control stays under the max temperature')
+    parser.add_argument('--sensor-interval', type=int, default=2, help='seconds')
+    args = parser.parse_args()
+
+    setpoint = args.max_temperature - args.margin
+    plant = DryerPlant()
+    strategies = [
+        ('always on', FixedDuty(1.0)),
+        ('fixed duty', FixedDuty((setpoint - plant.ambient) / plant.heater_rise)),
+        ('hysteresis', HysteresisController(setpoint)),
+        ('pid', PidController(setpoint)),
+    ]
+
+    print('{:<12} {:<18} {:>9} {:>9} {:>11} {:>9}'.format('strategy', 'result', 'time', 'max temp', 'mean temp', 'switches'))
+    for name, controller in strategies:
+        result, seconds, temperatures, switches = simulate(controller, args)
+        print('{:<12} {:<18} {:>8.2f}h {:>7.1f}°C {:>9.1f}°C {:>9d}'.format(
+            name, result, seconds / 3600, max(temperatures), np.mean(temperatures), switches))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+# history.py
+# latency of the run history with many logged runs, run from the Code directory with: python3 -m benchmarks.history
+import argparse
+import datetime
+import os
+import tempfile
+import time
+import numpy as np
+
+from lib import screens
+from lib.app import HeadlessApp
+from lib.runlog import RunLog, RunIndex, run_path
+
+def write_runs(directory, runs, samples):
+    # drying curves of different lengths, one run every day
+    first = datetime.datetime(2020, 1, 1, 8)
+    for run in range(runs):
+        start = first + datetime.timedelta(days=run)
+        length = samples // 2 + run * samples // runs
+        seconds = np.arange(length) * 2.0
+        humidity = 4 + 40 * np.exp(-seconds / (length / 2 + 1))
+        temperature = 60 - 20 * np.exp(-seconds / 600)
+        log = RunLog(run_path(directory, start), batch_size=4096, sync_interval=float('inf'))
+        for num in range(length):
+            log.append(start + datetime.timedelta(seconds=seconds[num]), humidity[num], temperature[num], True)
+        log.close()
+
+def timed(action):
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start
+
+def report(name, times):
+    print('{:<18} {:>5d} times {:8.2f}ms mean {:8.2f}ms max'.format(name, len(times), np.mean(times) * 1e3, np.max(times) * 1e3))
+
+def main():
+    parser = argparse.ArgumentParser(description='latency of the run history with many logged runs')
+    parser.add_argument('--runs', type=int, default=300, help='number of logged runs')
+    parser.add_argument('--samples', type=int, default=2000, help='samples of an average run')
+    parser.add_argument('--scrolls', type=int, default=50, help='scroll steps to measure')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        write_runs(directory, args.runs, args.samples)
+        print('wrote {} runs in {:.1f}s'.format(args.runs, time.perf_counter() - start))
+        report('Index build', [timed(lambda: RunIndex(directory).update())])
+        print('index size {:.1f}KB'.format(os.path.getsize(os.path.join(directory, 'runs.index')) / 1024))
+
+        app = HeadlessApp(run_directory=directory)
+        app.render()
+
+        def open_history():
+            with app.lock:
+                app.current_screen.switch_screen(screens.RunHistoryScreen)
+            app.render()
+
+        def scroll():
+            with app.lock:
+                app.current_screen.on_cwturn()
+            app.render()
+
+        def open_graph():
+            with app.lock:
+                app.current_screen.on_click()
+            app.render()
+
+        def close_graph():
+            with app.lock:
+                app.current_screen.on_click()
+            app.render()
+
+        # every open maps the index again and looks for logs that are missing in it
+        report('Open history', [timed(open_history) for _ in range(10)])
+        report('Scroll', [timed(scroll) for _ in range(args.scrolls)])
+        graph_times, back_times = [], []
+        for _ in range(10):
+            graph_times.append(timed(open_graph))
+            back_times.append(timed(close_graph))
+            scroll()
+        report('Open graph', graph_times)
+        report('Back to history', back_times)
+
+if __name__ == '__main__':
+    main()
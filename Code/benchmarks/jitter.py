@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+# jitter.py
+# timing jitter of the scheduled jobs while a process runs on the headless backend with the render
+# and sensor threads, run from the Code directory with: python3 -m benchmarks.jitter
+import argparse
+import math
+import time
+
+from lib import screens
+from lib.app import HeadlessApp
+
+def main():
+    parser = argparse.ArgumentParser(description='timing jitter of the scheduled jobs during a process')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of the process')
+    parser.add_argument('--beeps', type=float, default=20, help='short beeps per second, like a fast turned encoder')
+    args = parser.parse_args()
+
+    # a slowly drying load that never ends the process by itself
+    start = time.monotonic()
+    def read_sensors():
+        return 10 + 30 * math.exp(-(time.monotonic() - start) / 60), 50.0
+
+    app = HeadlessApp(read_sensors)
+    app.sensors.start()
+    app.renderer.start()
+    with app.lock:
+        app.current_screen.switch_screen(screens.ProgressScreen)
+
+    # beeps only schedule switching the beeper off again
+    beeper = [False]
+    def beep_off():
+        beeper[0] = False
+    def beep():
+        beeper[0] = True
+        app.scheduler.call_later(0.1, beep_off, name='beeper')
+    beeps = app.scheduler.every(1 / args.beeps, beep, name='encoder')
+
+    time.sleep(args.seconds)
+    beeps.cancel()
+    with app.lock:
+        app.current_screen.stop('Benchmark finished')
+    app.renderer.stop()
+    app.sensors.stop()
+    app.scheduler.stop()
+
+    print('{:<16} {:>7} {:>10} {:>10} {:>10}'.format('job', 'runs', 'mean late', 'max late', 'max run'))
+    for name, stats in sorted(app.scheduler.stats().items()):
+        print('{:<16} {:>7d} {:>8.2f}ms {:>8.2f}ms {:>8.2f}ms'.format(
+            name, stats['runs'], stats['average_lateness'] * 1e3, stats['max_lateness'] * 1e3, stats['max_duration'] * 1e3))
+    render = app.renderer.stats()
+    print('{} frames, {:.2f}ms mean, {:.2f}ms max, {} dropped'.format(
+        render['frames'], render['average_frame_time'] * 1e3, render['max_frame_time'] * 1e3, render['dropped_frames']))
+
+if __name__ == '__main__':
+    main()
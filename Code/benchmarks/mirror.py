@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+# mirror.py
+# bandwidth of the framebuffer mirror while a process is shown on the headless backend, compared to the
+# panel and to sending whole frames. Run from the Code directory with: python3 -m benchmarks.mirror
+import argparse
+import socket
+import threading
+import time
+import zlib
+import numpy as np
+
+from lib.mirror import FrameMirror
+from benchmarks.frames import show_progress, new_reading, tick, finish
+
+def receive(connection, size):
+    data = b''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if len(chunk) == 0:
+            raise ConnectionError
+        data += chunk
+    return data
+
+def view(connection, pixels, received):
+    # applies the tiles like the viewer does until the mirror closes the connection
+    try:
+        while True:
+            count, = FrameMirror.MESSAGE.unpack(receive(connection, FrameMirror.MESSAGE.size))
+            received['messages'] += 1
+            for _ in range(count):
+                x, y, width, height, length = FrameMirror.TILE.unpack(receive(connection, FrameMirror.TILE.size))
+                pixels[y:y + height, x:x + width] = np.frombuffer(zlib.decompress(receive(connection, length)), dtype='>u2').reshape(height, width)
+                received['tiles'] += 1
+    except ConnectionError:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='bandwidth of the framebuffer mirror during a process')
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--samples', type=int, default=10000, help='samples in the graph')
+    parser.add_argument('--port', type=int, default=5909)
+    args = parser.parse_args()
+
+    app = show_progress(args.samples)()
+    app.mirror_address = ('127.0.0.1', args.port)
+    app.start_mirror()
+
+    connection = socket.create_connection(app.mirror_address)
+    _, _, width, height, tile_size = FrameMirror.HEADER.unpack(receive(connection, FrameMirror.HEADER.size))
+    pixels = np.zeros((height, width), dtype='>u2')
+    received = {'messages': 0, 'tiles': 0}
+    viewer = threading.Thread(target=view, args=(connection, pixels, received), daemon=True)
+    viewer.start()
+
+    # the first frame after connecting is sent whole
+    with app.lock:
+        app.current_screen.invalidate()
+    app.render()
+    time.sleep(0.2)
+    initial = app.mirror.stats()['sent_bytes']
+
+    flushed_before = app.flushed_bytes
+    update_times = []
+    update = app.mirror.update
+    def timed_update(buffer, boxes):
+        start = time.perf_counter()
+        update(buffer, boxes)
+        update_times.append(time.perf_counter() - start)
+    app.mirror.update = timed_update
+    for step in [new_reading, tick] * (args.frames // 2):
+        with app.lock:
+            step(app)
+        app.render()
+        # about the pace of the panel, so the viewer keeps up
+        time.sleep(0.02)
+    time.sleep(0.5)
+
+    stats = app.mirror.stats()
+    matches = np.array_equal(pixels, app.framebuffer.front.pixels)
+    finish(app)
+    app.mirror.stop()
+    viewer.join()
+
+    frames = len(update_times)
+    print('{} frames, {} tiles of {}px, {:.2f}ms mean and {:.2f}ms max on the render thread'.format(
+        frames, received['tiles'], tile_size, np.mean(update_times) * 1e3, np.max(update_times) * 1e3))
+    print('first frame {:.1f}KB, then {:.2f}KB/frame mirrored, {:.2f}KB/frame to the panel, {:.1f}KB/frame whole'.format(
+        initial / 1024, (stats['sent_bytes'] - initial) / frames / 1024, (app.flushed_bytes - flushed_before) / frames / 1024, width * height * 2 / 1024))
+    print('{} damaged tiles hashed, {} changed, viewer matches the panel: {}'.format(stats['hashed_tiles'], stats['changed_tiles'], matches))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+# monitor.py
+# a process on the headless backend watched by streaming clients over the monitor server, one of them never
+# reads. Run from the Code directory with: python3 -m benchmarks.monitor
+import argparse
+import math
+import socket
+import threading
+import time
+
+from lib import screens
+from lib.app import HeadlessApp
+
+def request(address, path, headers=''):
+    connection = socket.create_connection(address)
+    connection.sendall('GET {} HTTP/1.1\r\nHost: localhost\r\n{}\r\n'.format(path, headers).encode())
+    return connection
+
+def read_stream(connection, result):
+    # counts the samples of a stream until the server closes it
+    data = b''
+    while True:
+        chunk = connection.recv(65536)
+        if len(chunk) == 0:
+            break
+        data += chunk
+        result['bytes'] += len(chunk)
+        *events, data = data.split(b'\n\n')
+        for event in events:
+            if b'event: sample' in event:
+                result['samples'] += 1
+                result['last_id'] = int(event.split(b'\n')[0][4:])
+    connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='monitor server under a process with several clients')
+    parser.add_argument('--seconds', type=float, default=5, help='duration of the process')
+    parser.add_argument('--clients', type=int, default=4, help='streaming clients')
+    parser.add_argument('--port', type=int, default=8089)
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    def read_sensors():
+        return 10 + 30 * math.exp(-(time.monotonic() - start) / 60), 50.0
+
+    app = HeadlessApp(read_sensors)
+    app.monitor_address = ('127.0.0.1', args.port)
+    app.start_monitor()
+    address = app.monitor_address
+    app.sensors.start()
+
+    results = []
+    threads = []
+    for num in range(args.clients):
+        result = {'samples': 0, 'bytes': 0, 'last_id': None}
+        thread = threading.Thread(target=read_stream, args=(request(address, '/events'), result), daemon=True)
+        thread.start()
+        results.append(result)
+        threads.append(thread)
+    # connected but never reading, the server must drop it instead of buffering for it
+    stalled = request(address, '/events')
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    time.sleep(0.2)
+
+    with app.lock:
+        app.current_screen.switch_screen(screens.ProgressScreen)
+    time.sleep(args.seconds)
+
+    status = request(address, '/status')
+    response = b''
+    while True:
+        chunk = status.recv(65536)
+        if len(chunk) == 0:
+            break
+        response += chunk
+    status.close()
+
+    with app.lock:
+        app.current_screen.stop('Benchmark finished')
+    app.sensors.stop()
+    app.scheduler.stop()
+    time.sleep(0.2)
+    monitor = app.monitor.stats()
+    app.monitor.stop()
+    for thread in threads:
+        thread.join()
+    stalled.close()
+
+    for num, result in enumerate(results):
+        print('client {}: {} samples, {:.1f}KB'.format(num, result['samples'], result['bytes'] / 1024))
+    print('{} events, {} dropped clients, {} rejected clients'.format(monitor['events'], monitor['dropped_clients'], monitor['rejected_clients']))
+    print('status: {}'.format(response.split(b'\r\n\r\n', 1)[1].decode()))
+    reader = app.scheduler.stats()['sensor_reader']
+    print('sensor_reader: {:.2f}ms mean late, {:.2f}ms max late, {:.2f}ms max run'.format(
+        reader['average_lateness'] * 1e3, reader['max_lateness'] * 1e3, reader['max_duration'] * 1e3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+# startup.py
+# time to the first presented frame of run.py and devmock.py, started like on the device in a fresh
+# interpreter with DRYER_EXIT_AFTER_FIRST_FRAME set, and import time and time to first frame of the
+# headless app. Run from the Code directory with:
+# python3 -m benchmarks.startup [run.py] [devmock.py] [headless]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+CODE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ('run.py', 'devmock.py')
+TARGETS = SCRIPTS + ('headless',)
+MARKER = 'first frame presented'
+
+# packages the hardware path should not load unless it really uses them
+WATCHED_MODULES = ('numpy', 'PIL', 'matplotlib', 'tkinter', 'pandas', 'scipy', 'RPi', 'Adafruit_ILI9341', 'Adafruit_DHT', 'asyncio')
+
+# runs the entry point as its own __main__ and reports the loaded packages once it exits
+WRAPPER = '''
+import atexit, json, runpy, sys
+atexit.register(lambda: print(json.dumps(sorted(name for name in {modules!r} if name in sys.modules)), flush=True))
+sys.argv = [{script!r}]
+runpy.run_path({script!r}, run_name='__main__')
+'''
+
+def measure():
+    # runs in the fresh interpreter
+    start = time.perf_counter()
+    import lib.app
+    imported = time.perf_counter()
+    app = lib.app.HeadlessApp()
+    constructed = time.perf_counter()
+    app.render()
+    first_frame = time.perf_counter()
+
+    print(json.dumps({
+        'import': imported - start,
+        'init': constructed - imported,
+        'first_frame': first_frame - start,
+        'modules': sorted(name for name in WATCHED_MODULES if name in sys.modules),
+    }))
+
+def start_script(script, timeout):
+    # seconds from spawning the interpreter until the app presented its first frame and until it exited,
+    # an app that didn't exit after timeout seconds is killed
+    environment = dict(os.environ, DRYER_EXIT_AFTER_FIRST_FRAME='1')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', WRAPPER.format(modules=WATCHED_MODULES, script=script)],
+                               cwd=CODE_DIRECTORY, env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    first_frame = None
+    lines = []
+    for line in process.stdout:
+        if first_frame is None and line.strip() == MARKER:
+            first_frame = time.perf_counter() - start
+        lines.append(line)
+    error = process.stderr.read()
+    process.wait()
+    wall = time.perf_counter() - start
+    timer.cancel()
+    if first_frame is None:
+        error = error.strip().splitlines()
+        raise RuntimeError(error[-1] if error else 'exited with {} before the first frame'.format(process.returncode))
+    # a killed app never reports its packages
+    modules = json.loads(lines[-1]) if lines[-1].startswith('[') else []
+    return {'first_frame': first_frame, 'wall': wall, 'modules': modules}
+
+def start_headless():
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--measure'], cwd=CODE_DIRECTORY,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()
+        raise RuntimeError(error[-1] if error else process.returncode)
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['wall'] = wall
+    return result
+
+def run(target, repeat, timeout):
+    results = []
+    for _ in range(repeat):
+        try:
+            results.append(start_headless() if target == 'headless' else start_script(target, timeout))
+        except RuntimeError as error:
+            print('{:<12} failed: {}'.format(target, error))
+            return
+
+    def median(key):
+        return sorted(result[key] for result in results)[len(results) // 2] * 1e3
+
+    if target == 'headless':
+        print('{:<12} import {:8.1f}ms  init {:8.1f}ms  first frame {:8.1f}ms  process {:8.1f}ms  loaded: {}'.format(
+            target, median('import'), median('init'), median('first_frame'), median('wall'), ', '.join(results[-1]['modules'])))
+    else:
+        # the first frame is counted from spawning the interpreter, it includes the interpreter's own startup
+        print('{:<12} first frame {:8.1f}ms  process {:8.1f}ms  loaded: {}'.format(
+            target, median('first_frame'), median('wall'), ', '.join(results[-1]['modules'])))
+
+def main():
+    parser = argparse.ArgumentParser(description='time to the first frame of the apps')
+    parser.add_argument('targets', nargs='*', help='apps to start, any of {}'.format(', '.join(TARGETS)))
+    parser.add_argument('--repeat', type=int, default=3, help='fresh starts per app, the median is reported')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds until an app that never presents a frame is killed')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure()
+        return
+
+    for target in args.targets or list(TARGETS):
+        if target not in TARGETS:
+            parser.error('unknown app {}'.format(target))
+        run(target, args.repeat, args.timeout)
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,28 @@
-from . import screens, themes, pins, hal
-from .mocks import Relay as MockRelay, Beeper as MockBeeper, DHT22SampleVals as MockDHT22
+from . import screens, themes, pins
+from .utils import clip_box, merge_boxes, widget_layers
+from .render import Renderer
+from .sensors import SensorWorker
+from .framebuffer import FrameBuffer, SwapChain
+from .checkpoint import Checkpoint
+from .input import InputQueue
+from .scheduler import Scheduler, Worker
+from .metrics import metrics
 
-import matplotlib
-matplotlib.use("TkAgg")
-
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import tkinter as Tk
-from PIL import Image
 import numpy as np
 
 from functools import partial
 import queue
 import math
 import datetime
+import os
 import threading
 import time
 import queue
 import atexit
+import traceback
 
-import RPi.GPIO as GPIO
-
-import Adafruit_ILI9341 as TFT
-import Adafruit_GPIO.SPI as SPI
-import Adafruit_DHT
+# the hardware and the mock window need packages that are only installed where they run,
+# they are imported by the apps using them
 
 class App:
     def __init__(self):
@@ -32,24 +31,172 @@ class App:
         self.target_humidity = 4
         self.max_temperature = 75
         self.max_runtime = datetime.timedelta(hours = 6)
+        # the heater is switched to hold the chamber this many degrees under the max temperature,
+        # without control it is on for the whole process
+        self.heater_control = True
+        self.temperature_margin = 3
         self.set_eta = None
+        # how the time left is predicted, one of eta.MODELS
+        self.eta_model = 'cubic'
         self.intermeasurement_delay = 1
-
+        # seconds until a sample counts as stale and until a process gives up on the sensor
+        self.sensor_max_age = 10
+        self.sensor_timeout = 60
+        self.display_size = (240, 320)
+        # every run is logged to a file in this directory, None disables the logs
+        self.run_directory = 'runs'
+        # seconds between two checkpoints of a running process, a crash loses at most this much of a run
+        self.checkpoint_interval = 30
+        # the metrics are written to this file in the Prometheus text format every metrics_interval seconds,
+        # e.g. for the textfile collector of the node exporter. None disables the file
+        self.metrics_file = 'metrics.prom'
+        self.metrics_interval = 60
+        # (host, port) of the HTTP server to watch a process from the network, None disables it
+        self.monitor_address = None
+        self.monitor = None
+        # (host, port) viewers of the framebuffer mirror connect to, None disables it. Only the apps
+        # sending RGB565 frames to a SwapChain can be mirrored
+        self.mirror_address = None
+        self.mirror = None
+        self.heater = False
+        # return from run() once the first frame was presented, for timing the startup with benchmarks/startup.py
+        self.exit_after_first_frame = 'DRYER_EXIT_AFTER_FIRST_FRAME' in os.environ
+
+        # guards the state of the screens between input, worker and render threads
+        self.lock = threading.RLock()
+        self.renderer = Renderer(self)
         self.channel = queue.Queue()
+        # timed outputs and periodic jobs all run on this one thread
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+        # run logs, checkpoints, the run index and the metrics file are written on this thread,
+        # the others only queue the writes
+        self.storage = Worker('storage')
+        self.storage.start()
+        self.scheduler.every(self.metrics_interval, self.write_metrics, name='metrics')
+        # fast turns of the encoder change values in bigger steps while editing
+        self.input = InputQueue(self.invalidate_display, acceleration=True)
+        # feedback for every handled input, e.g. a beep
+        self.notify_input = lambda: None
 
     def invalidate_display(self):
-        self.channel.put('invalid')
+        # only marks the screen dirty, the renderer draws it with the next frame
+        self.renderer.invalidate()
+
+    def present(self, damage):
+        # damage is a list of boxes in display coordinates that changed with the last frame
+        self.channel.put(damage)
+
+    def windows(self, damage):
+        # the damaged boxes on the panel and the address windows to send for them
+        boxes = [clip_box(box, self.display_size) for box in damage]
+        boxes = [box for box in boxes if box is not None]
+        return boxes, merge_boxes(boxes, RealApp.WINDOW_OVERHEAD_PIXELS)
+
+    def write_metrics(self):
+        # a scheduler job, the file is written by the storage worker
+        if self.metrics_file is not None:
+            self.storage.submit(partial(metrics.write, self.metrics_file))
+
+    def start_monitor(self):
+        # the app runs without the server if it can't listen
+        if self.monitor_address is None:
+            return
+        # asyncio is only loaded when the server is enabled
+        from .monitor import MonitorServer
+        monitor = MonitorServer(*self.monitor_address)
+        try:
+            monitor.start()
+        except OSError:
+            traceback.print_exc()
+            return
+        self.monitor = monitor
+
+    def start_mirror(self):
+        # the app runs without the mirror if it can't listen
+        if self.mirror_address is None:
+            return
+        # sockets, hashing and compression are only loaded when the mirror is enabled
+        from .mirror import FrameMirror
+        mirror = FrameMirror(self.display_size, *self.mirror_address, input=self.input)
+        try:
+            mirror.start()
+        except OSError:
+            traceback.print_exc()
+            return
+        # viewers start from the frame presented so far, call before the renderer is started
+        mirror.update(self.framebuffer.front, [(0, 0) + self.display_size])
+        self.mirror = mirror
+
+    def first_frame_presented(self):
+        # the marker benchmarks/startup.py stops its clock at
+        print('first frame presented', flush=True)
+
+    def publish_status(self, status, sample=None):
+        # called with the lock held, see MonitorServer.publish
+        if self.monitor is not None:
+            self.monitor.publish(status, sample)
+
+    def dispatch_input(self):
+        # runs on the render thread with the lock held, every run of turns is handled as one event
+        events = self.input.drain()
+        for event in events:
+            if event[0] == 'turn':
+                self.current_screen.on_turn(event[1], event[2])
+            elif event[0] == 'click':
+                self.current_screen.on_click()
+            elif event[0] == 'long_click':
+                self.toggle_theme()
+        if len(events) > 0:
+            self.notify_input()
+
+    def resume_interrupted_run(self):
+        # continue a process that was interrupted by a crash or a power loss, returns whether there was one
+        if self.run_directory is None:
+            return False
+        checkpoint = Checkpoint(self.run_directory)
+        try:
+            state = checkpoint.load()
+            if state is None:
+                return False
+            if not os.path.exists(state['log']):
+                checkpoint.clear()
+                return False
+            self.current_screen = screens.ProgressScreen(self.display, self.display_size, app=self, resume=state)
+        except Exception:
+            # a checkpoint that can't be resumed must not keep the app from starting, it is dropped
+            # and the app starts over with the heater off
+            traceback.print_exc()
+            checkpoint.clear()
+            self.process_running = False
+            self.heater_off()
+            self.current_screen = screens.StartScreen(self.display, self.display_size, app=self)
+            return False
+        return True
 
-    def wait_for_display(self):
-        #while not self.channel.empty():
-        #    time.sleep(0.01)
-        pass
+    def toggle_theme(self):
+        with self.lock:
+            # the widgets are painted again anyway, the layers of the old theme would only take memory
+            widget_layers.discard_theme(type(self.theme).__name__)
+            self.theme = themes.DarkTheme() if type(self.theme) == themes.LightTheme else themes.LightTheme()
+            self.current_screen.invalidate()
 
 
 class RealApp(App):
+    # setting up an address window costs about as much bus time as sending this many pixels
+    WINDOW_OVERHEAD_PIXELS = 1024
+    # the largest transfer spidev accepts by default
+    SPI_CHUNK_SIZE = 4096
+
     def __init__(self):
         super().__init__()
 
+        from . import hal
+        import RPi.GPIO as GPIO
+        import Adafruit_ILI9341 as TFT
+        import Adafruit_GPIO.SPI as SPI
+        import Adafruit_DHT
+
         GPIO.setmode(GPIO.BCM)
 
         self.backlight = hal.IO(pins.TFT_BL)
@@ -59,11 +206,15 @@ class RealApp(App):
         self.bootled = hal.IO(pins.BOOT_LED)
         self.bootled.on()
 
-        self.display = TFT.ILI9341(pins.TFT_DC, rst=pins.TFT_RST, spi=SPI.SpiDev(pins.TFT_SPI_PORT, pins.TFT_SPI_DEVICE, max_speed_hz=64000000))
-        TFT_SIZE = (240, 320)
+        spi = SPI.SpiDev(pins.TFT_SPI_PORT, pins.TFT_SPI_DEVICE, max_speed_hz=64000000)
+        self.display = TFT.ILI9341(pins.TFT_DC, rst=pins.TFT_RST, spi=spi)
         self.display.begin()
+        # spidev's writebytes, which the driver uses, turns every byte into an item of a list. Newer spidev
+        # versions have writebytes2 taking the buffer as it is and splitting it into transfers themselves
+        self.write_pixels = getattr(spi._device, 'writebytes2', None)
+        self.framebuffer = SwapChain(self.display_size, self.flush)
 
-        self.current_screen = screens.StartScreen(self.display, TFT_SIZE, app=self)
+        self.current_screen = screens.StartScreen(self.display, self.display_size, app=self)
 
         self.encoder = hal.Encoder(pins.ENC_CLK, pins.ENC_DAT, pins.ENC_BTN)
                 
@@ -73,9 +224,17 @@ class RealApp(App):
         # Make sure heater is initially off
         self.switch_heater(False)
 
-        self.beeper = hal.Beeper(pins.BEEPER)
+        self.beeper = hal.Beeper(pins.BEEPER, self.scheduler)
 
         def cleanup():
+            if self.monitor is not None:
+                self.monitor.stop()
+            if self.mirror is not None:
+                self.mirror.stop()
+            self.scheduler.stop()
+            # the queued writes of a run are finished before the app exits
+            self.storage.stop()
+            self.framebuffer.stop()
             self.switch_heater(False)
             self.beeper.off()
             self.bootled.off()
@@ -84,34 +243,25 @@ class RealApp(App):
             GPIO.cleanup()
         atexit.register(cleanup)
 
-        def click():
-            self.beeper.short_beep()
-            self.current_screen.on_click()
+        # the interrupt threads only queue the events, they are handled with the next frame
+        self.encoder.on_click(self.input.click)
+        self.encoder.on_turn(lambda counter_clockwise: self.input.turn(-1 if counter_clockwise else 1))
+        self.encoder.on_long_click(self.input.long_click)
+        self.notify_input = self.beeper.short_beep
 
-        def turn(dir):
-            self.beeper.short_beep()
-            if dir:
-                self.current_screen.on_ccwturn()  
-            else:
-                 self.current_screen.on_cwturn()
-
-        self.encoder.on_click(click)
-        self.encoder.on_turn(turn)
-        self.encoder.on_long_click(lambda: self.toggle_theme())
-
-        self.read_sensors = partial(Adafruit_DHT.read_retry, Adafruit_DHT.DHT22, pins.DHT22)
+        # single attempts only, the worker retries with the next interval. The DHT22 can't be read
+        # more often than every 2 seconds
+        self.sensors = SensorWorker(partial(Adafruit_DHT.read, Adafruit_DHT.DHT22, pins.DHT22), interval=2, max_age=self.sensor_max_age)
         self.heater_on = partial(self.switch_heater, True)
         self.heater_off = partial(self.switch_heater, False)
         self.notify_user = self.beeper.long_beep
         self.intermeasurement_delay = 0.1
 
-        self.current_screen.draw()
-
-    def toggle_theme(self):
-        self.theme = themes.DarkTheme() if type(self.theme) == themes.LightTheme else themes.LightTheme()
-        self.current_screen.draw()
+        self.resume_interrupted_run()
+        self.current_screen.invalidate()
 
     def switch_heater(self, state):
+        self.heater = state
         if state:
             self.relay1.on()
             self.relay2.on()
@@ -120,37 +270,70 @@ class RealApp(App):
             self.relay2.off()
 
     def run(self):
-        threading.Timer(0.033, self.display_loop).start()
+        self.sensors.start()
+        self.framebuffer.start()
+        self.start_mirror()
+        self.renderer.start()
+        self.start_monitor()
+        if self.exit_after_first_frame:
+            # the frame is on the panel once the transmit thread sent it
+            while self.framebuffer.frames == 0:
+                time.sleep(0.001)
+            self.first_frame_presented()
+            return
         while True:
             time.sleep(1)
 
-    def display_loop(self):
-        try:
-            self.channel.get(block=True)
-            self.display.display()
-        except queue.Empty:
-            pass
-        threading.Timer(0.033, self.display_loop).start()
+    def present(self, damage):
+        # runs on the render thread right after the frame was drawn, the next frame is drawn
+        # while the transmit thread sends this one
+        boxes, windows = self.windows(damage)
+        self.framebuffer.present(self.display.buffer, boxes, windows)
+        if self.mirror is not None:
+            self.mirror.update(self.framebuffer.front, boxes)
+
+    def flush(self, buffer, box):
+        # only send the damaged box using the address window of the panel. The RGB565 framebuffer is
+        # sent without converting the image like the driver's display() would
+        x0, y0, x1, y1 = box
+        self.display.set_window(x0, y0, x1 - 1, y1 - 1)
+        if self.write_pixels is not None:
+            # sending nothing only switches the panel to data
+            self.display.send(b'', True)
+            self.write_pixels(buffer.window(box))
+        else:
+            self.display.send(buffer.window(box), True, chunk_size=RealApp.SPI_CHUNK_SIZE)
 
 class MockApp(App):
     def __init__(self):
         super().__init__()
 
-        relay = MockRelay(1)
+        from .mocks import Relay as MockRelay, Beeper as MockBeeper, DHT22SampleVals as MockDHT22
+        import matplotlib
+        matplotlib.use("TkAgg")
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        import tkinter as Tk
+
+        self.relay = MockRelay(1)
         beeper = MockBeeper(1)
 
-        self.read_sensors = partial(MockDHT22().read_retry, 0, 0)
-        self.heater_on = relay.on
-        self.heater_off = relay.off
+        # the recording is replayed at the pace it was taken, the worker reads it from the start of the app.
+        # A sample stays fresh for at least two intervals of the recording
+        recording = MockDHT22()
+        self.sensors = SensorWorker(partial(recording.read_retry, 0, 0), interval=recording.interval,
+                                    max_age=max(self.sensor_max_age, 2 * recording.interval))
+        self.heater_on = partial(self.switch_heater, True)
+        self.heater_off = partial(self.switch_heater, False)
         self.notify_user = beeper.long_beep
         self.intermeasurement_delay = 0.01
 
-        self.display = Image.new('RGBA', (240, 320), (0, 0, 0))
-        TFT_SIZE = self.display.size
+        self.display = FrameBuffer(self.display_size)
+        self.current_screen = screens.StartScreen(self.display, self.display_size, app=self)
 
         self.root = Tk.Tk()
         self.root.wm_title("Smart Dry Mock")
-        self.root.image = np.rot90(np.asarray(self.display))
+        self.root.image = np.rot90(np.asarray(self.display.buffer))
         fig = plt.figure(figsize = (5,5))
         self.im = plt.imshow(self.root.image)
         ax = plt.gca()
@@ -166,30 +349,101 @@ class MockApp(App):
         Tk.Button(self.root, text="Click", command=self.btn_clicked).pack()
         Tk.Button(self.root, text="longpress", command=self.longclick_clicked).pack()
 
-        self.current_screen.draw()
+        self.resume_interrupted_run()
+        self.current_screen.invalidate()
+
+    def switch_heater(self, state):
+        self.heater = state
+        if state:
+            self.relay.on()
+        else:
+            self.relay.off()
 
     def cw_clicked(self):
-        self.current_screen.on_cwturn()
+        self.input.turn(1)
         
     def ccw_clicked(self):
-        self.current_screen.on_ccwturn()
+        self.input.turn(-1)
         
     def btn_clicked(self):
-        self.current_screen.on_click()
+        self.input.click()
         
     def longclick_clicked(self):
-        self.theme = themes.DarkTheme() if type(self.theme) == themes.LightTheme else themes.LightTheme()
+        self.input.long_click()
 
     def run(self):
+        self.sensors.start()
+        self.renderer.start()
+        self.start_monitor()
         self.root.after(33, self.display_loop)
         self.root.mainloop()
 
+    def present(self, damage):
+        # a copy of the finished frame, so the window never shows one that is still being drawn
+        self.channel.put(np.asarray(self.display.buffer))
+
     def display_loop(self):
+        # only the newest of the frames presented since the last update is shown
+        frame = None
         try:
-            self.channel.get(block=False)
-            self.root.image = np.rot90(np.asarray(self.display))
-            self.im.set_data(self.root.image)
-            self.canvas.draw()
+            while True:
+                frame = self.channel.get(block=False)
         except queue.Empty:
             pass
-        self.root.after(33, self.display_loop)
\ No newline at end of file
+        if frame is not None:
+            self.root.image = np.rot90(frame)
+            self.im.set_data(self.root.image)
+            self.canvas.draw()
+            if self.exit_after_first_frame:
+                self.first_frame_presented()
+                self.root.quit()
+                return
+        self.root.after(33, self.display_loop)
+
+class HeadlessApp(App):
+    # renders into a plain image without any hardware or window, frames are drawn on demand
+    # with render() instead of the render thread, e.g. for benchmarks
+
+    def __init__(self, read_sensors=None, run_directory=None):
+        super().__init__()
+        self.run_directory = run_directory
+        self.metrics_file = None
+
+        if read_sensors is None:
+            from .mocks import DHT22 as MockDHT22
+            read_sensors = partial(MockDHT22().read_retry, 0, 0)
+        self.sensors = SensorWorker(read_sensors, interval=0.01, max_age=self.sensor_max_age)
+        self.heater_on = partial(self.switch_heater, True)
+        self.heater_off = partial(self.switch_heater, False)
+        self.notify_user = lambda: None
+        self.intermeasurement_delay = 0.01
+
+        # bytes a partial flush to the panel would have sent
+        self.flushed_bytes = 0
+        self.flushes = 0
+
+        self.display = FrameBuffer(self.display_size)
+        # the transmit thread isn't started, frames are sent when they are presented
+        self.framebuffer = SwapChain(self.display_size, self.flush)
+        self.current_screen = screens.StartScreen(self.display, self.display_size, app=self)
+        self.current_screen.invalidate()
+
+    def switch_heater(self, state):
+        self.heater = state
+
+    def present(self, damage):
+        # converts and accounts for the same windows RealApp would send
+        boxes, windows = self.windows(damage)
+        self.framebuffer.present(self.display.buffer, boxes, windows)
+        if self.mirror is not None:
+            self.mirror.update(self.framebuffer.front, boxes)
+
+    def flush(self, buffer, box):
+        self.flushed_bytes += len(buffer.window(box))
+        self.flushes += 1
+
+    def render(self):
+        self.renderer.render_frame()
+
+    def frame(self):
+        return np.asarray(self.display.buffer)
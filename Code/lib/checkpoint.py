@@ -0,0 +1,50 @@
+# checkpoint.py
+import json
+import os
+
+class Checkpoint:
+    # the state of a running process that isn't in its run log, small and of constant size so saving it
+    # costs the same no matter how long the run is. It is replaced atomically, a crash while saving leaves
+    # the previous checkpoint behind.
+
+    NAME = 'checkpoint.json'
+    VERSION = 2
+    # older checkpoints are still resumed, version 1 has no eta_model and its estimator state no last_seconds
+    OLDEST_VERSION = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, Checkpoint.NAME)
+        self.saves = 0
+
+    def save(self, state):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(dict(state, version=Checkpoint.VERSION), file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+        # the rename itself only survives a power loss once the directory is synced
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self.saves += 1
+
+    def load(self):
+        # the state of the interrupted process or None if there is none
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if state.get('version') not in range(Checkpoint.OLDEST_VERSION, Checkpoint.VERSION + 1):
+            return None
+        return state
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
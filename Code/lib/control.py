@@ -0,0 +1,96 @@
+# control.py
+import math
+
+class PidController:
+    # duty cycle of the heater from the chamber temperature. The derivative acts on the filtered measurement,
+    # so neither a new setpoint nor the coarse steps of the sensor kick the output, and the integral
+    # stops growing while the output is saturated.
+
+    def __init__(self, setpoint, kp=0.15, ki=0.0003, kd=20.0, derivative_time=60.0):
+        self.setpoint = setpoint
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.derivative_time = derivative_time
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.last_time = None
+        self.last_measurement = None
+        self.duty = 0.0
+
+    def update(self, now, measurement):
+        error = self.setpoint - measurement
+        dt = now - self.last_time if self.last_time is not None else 0
+        if dt > 0:
+            slope = (measurement - self.last_measurement) / dt
+            self.derivative += (slope - self.derivative) * min(dt / self.derivative_time, 1)
+        self.last_time = now
+        self.last_measurement = measurement
+
+        integral = self.integral + self.ki * error * dt
+        output = self.kp * error + integral - self.kd * self.derivative
+        # only integrate while that doesn't push the output further into saturation
+        if 0 < output < 1 or (output >= 1 and error < 0) or (output <= 0 and error > 0):
+            self.integral = integral
+        self.duty = min(max(self.kp * error + self.integral - self.kd * self.derivative, 0.0), 1.0)
+        return self.duty
+
+class HysteresisController:
+    # full power below the band under the setpoint, off at the setpoint and unchanged in between
+    def __init__(self, setpoint, band=3.0):
+        self.setpoint = setpoint
+        self.band = band
+        self.duty = 1.0
+
+    def update(self, now, measurement):
+        if measurement >= self.setpoint:
+            self.duty = 0.0
+        elif measurement < self.setpoint - self.band:
+            self.duty = 1.0
+        return self.duty
+
+class TimeProportionalRelay:
+    # turns a duty cycle into on and off times of a relay, the heater is on for duty * period at the
+    # start of every period. On or off times shorter than min_switch_time are skipped to spare the relays.
+
+    def __init__(self, switch, period=60.0, min_switch_time=5.0):
+        # switch(state) turns the heater on or off
+        self.switch = switch
+        self.period = period
+        self.min_switch_time = min_switch_time
+        self.duty = 0.0
+        self.state = None
+        self.last_switch = -math.inf
+        self.switches = 0
+
+    def on_time(self):
+        on_time = self.duty * self.period
+        if on_time < self.min_switch_time:
+            return 0.0
+        if self.period - on_time < self.min_switch_time:
+            return self.period
+        return on_time
+
+    def update(self, now):
+        state = (now % self.period) < self.on_time()
+        if state != self.state and now - self.last_switch >= self.min_switch_time:
+            self.state = state
+            self.last_switch = now
+            self.switches += 1
+            self.switch(state)
+        return self.state
+
+class HeaterController:
+    # holds the chamber just under its maximum temperature, the controller gets every temperature reading
+    # and the relay is updated more often than that to switch on time
+    def __init__(self, controller, relay):
+        self.controller = controller
+        self.relay = relay
+
+    def measure(self, now, temperature):
+        if temperature is None or math.isnan(temperature):
+            return
+        self.relay.duty = self.controller.update(now, temperature)
+
+    def update(self, now):
+        return self.relay.update(now)
@@ -0,0 +1,196 @@
+# eta.py
+from collections import deque
+from math import isnan, log
+import numpy as np
+
+class EtaModel:
+    # predicts the runtime in seconds at which the humidity reaches a target. Samples arrive one at a time
+    # and every update costs the same no matter how long the process runs.
+
+    def add_sample(self, seconds, value):
+        raise NotImplementedError('Your model should Override the add_sample() Method')
+
+    def eta(self, target):
+        # seconds of runtime, None without a prediction
+        raise NotImplementedError('Your model should Override the eta() Method')
+
+    def state(self):
+        # everything the prediction depends on, a restored model continues where this one is
+        raise NotImplementedError('Your model should Override the state() Method')
+
+    def restore(self, state):
+        raise NotImplementedError('Your model should Override the restore() Method')
+
+class EtaEstimator(EtaModel):
+    # weighted least squares fit of a cubic to the humidity readings, updated with running sums
+    # of the normal equations so every sample costs the same no matter how long the process runs.
+    # Sample i gets the weight i ** 2 like the np.polyfit(w=...) fit it replaces.
+
+    DEGREE = 3
+
+    def __init__(self, time_scale=3600.0):
+        # seconds are scaled to hours to keep the moments well conditioned
+        self.time_scale = time_scale
+        self.samples = 0
+        self.valid_samples = 0
+        self.last_seconds = None
+        self.exponents = np.arange(2 * EtaEstimator.DEGREE + 1)
+        # sum of w * t ** k for k = 0..2*DEGREE
+        self.moments = np.zeros(2 * EtaEstimator.DEGREE + 1)
+        # sum of w * t ** k * y for k = 0..DEGREE
+        self.targets = np.zeros(EtaEstimator.DEGREE + 1)
+
+    def add_sample(self, seconds, value):
+        index = self.samples
+        self.samples += 1
+        # missing readings keep their place so the weights match the batch fit
+        if value is None or isnan(value):
+            return
+        self.last_seconds = seconds
+
+        # polyfit weights the residuals, so the squared error is weighted by w ** 2
+        weight = float(index) ** 4
+        powers = (seconds / self.time_scale) ** self.exponents
+        self.moments += weight * powers
+        self.targets += (weight * value) * powers[:EtaEstimator.DEGREE + 1]
+        self.valid_samples += 1
+
+    def state(self):
+        return {
+            'samples': self.samples,
+            'valid_samples': self.valid_samples,
+            'last_seconds': self.last_seconds,
+            'moments': self.moments.tolist(),
+            'targets': self.targets.tolist(),
+        }
+
+    def restore(self, state):
+        self.samples = state['samples']
+        self.valid_samples = state['valid_samples']
+        self.last_seconds = state['last_seconds']
+        self.moments = np.array(state['moments'])
+        self.targets = np.array(state['targets'])
+
+    def coefficients(self):
+        # polynomial coefficients for t in seconds, highest power first like np.polyfit
+        if self.valid_samples <= EtaEstimator.DEGREE:
+            return None
+
+        size = EtaEstimator.DEGREE + 1
+        matrix = self.moments[np.add.outer(np.arange(size), np.arange(size))]
+        # equilibrate the normal equations before solving them
+        scale = 1 / np.sqrt(np.diag(matrix))
+        solution, _, _, _ = np.linalg.lstsq(matrix * np.outer(scale, scale), self.targets * scale, rcond=None)
+        coeffs = solution * scale / self.time_scale ** np.arange(size)
+        return coeffs[::-1]
+
+    def eta(self, target):
+        # the first time after the last sample where the cubic crosses the target, earlier roots
+        # are where the fit crosses it within the data
+        coeffs = self.coefficients()
+        if coeffs is None:
+            return None
+        roots = (np.poly1d(coeffs) - target).roots
+        roots = roots[np.isreal(roots)].real
+        roots = roots[roots > self.last_seconds]
+        return roots.min() if len(roots) > 0 else None
+
+class ExponentialModel(EtaModel):
+    # humidity decaying exponentially towards a floor. ln(humidity - floor) is fitted to a line with
+    # weights halving every half_life seconds, so the fit follows the current phase of the process.
+
+    def __init__(self, floor=0.0, half_life=3600.0, time_scale=3600.0):
+        self.floor = floor
+        self.half_life = half_life
+        self.time_scale = time_scale
+        self.samples = 0
+        self.last_seconds = None
+        # sum of w, w * t, w * t ** 2, w * y and w * t * y
+        self.sums = np.zeros(5)
+
+    def add_sample(self, seconds, value):
+        self.samples += 1
+        if value is None or isnan(value) or value <= self.floor:
+            return
+        if self.last_seconds is not None:
+            self.sums *= 0.5 ** ((seconds - self.last_seconds) / self.half_life)
+        self.last_seconds = seconds
+        t = seconds / self.time_scale
+        y = log(value - self.floor)
+        self.sums += (1, t, t * t, y, t * y)
+
+    def eta(self, target):
+        weight, t, tt, y, ty = self.sums
+        determinant = weight * tt - t * t
+        if target <= self.floor or determinant <= 1e-9 * weight * weight:
+            return None
+        slope = (weight * ty - t * y) / determinant
+        if slope >= 0:
+            return None
+        intercept = (y - slope * t) / weight
+        return (log(target - self.floor) - intercept) / slope * self.time_scale
+
+    def state(self):
+        return {'samples': self.samples, 'last_seconds': self.last_seconds, 'sums': self.sums.tolist()}
+
+    def restore(self, state):
+        self.samples = state['samples']
+        self.last_seconds = state['last_seconds']
+        self.sums = np.array(state['sums'])
+
+class SlopeModel(EtaModel):
+    # extends the straight line through the samples of the last window seconds, running sums are updated
+    # for every sample entering and leaving the window
+
+    def __init__(self, window=1800.0, time_scale=3600.0):
+        self.window = window
+        self.time_scale = time_scale
+        self.samples = 0
+        self.recent = deque()
+        # sum of 1, t, t ** 2, y and t * y over the window
+        self.sums = np.zeros(5)
+
+    def add_sample(self, seconds, value):
+        self.samples += 1
+        if value is None or isnan(value):
+            return
+        t = seconds / self.time_scale
+        self.recent.append((t, value))
+        self.sums += (1, t, t * t, value, t * value)
+        while self.recent[0][0] < t - self.window / self.time_scale:
+            old_t, old_value = self.recent.popleft()
+            self.sums -= (1, old_t, old_t * old_t, old_value, old_t * old_value)
+
+    def eta(self, target):
+        count, t, tt, y, ty = self.sums
+        determinant = count * tt - t * t
+        if count < 2 or determinant <= 1e-9 * count * count:
+            return None
+        slope = (count * ty - t * y) / determinant
+        if slope >= 0:
+            return None
+        intercept = (y - slope * t) / count
+        return (target - intercept) / slope * self.time_scale
+
+    def state(self):
+        return {'samples': self.samples, 'recent': list(self.recent)}
+
+    def restore(self, state):
+        self.samples = state['samples']
+        self.recent = deque()
+        self.sums = np.zeros(5)
+        for t, value in state['recent']:
+            self.recent.append((t, value))
+            self.sums += (1, t, t * t, value, t * value)
+
+# the models a process can use by their name in the settings
+MODELS = {
+    'cubic': EtaEstimator,
+    'exponential': ExponentialModel,
+    'slope': SlopeModel,
+}
+
+def batch_coefficients(seconds, values):
+    # the reference fit over the complete history
+    weights = [x ** 2 for x in range(len(seconds))]
+    return np.polyfit(seconds, values, w=weights, deg=EtaEstimator.DEGREE)
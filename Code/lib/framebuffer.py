@@ -0,0 +1,131 @@
+# framebuffer.py
+from PIL import Image, ImageDraw
+import numpy as np
+import threading
+import time
+
+from .metrics import metrics
+
+class FrameBuffer:
+    # drawing target with the same interface as the ILI9341 driver, but without a panel behind it
+    def __init__(self, size):
+        self.width, self.height = size
+        self.buffer = Image.new('RGB', size)
+
+    def draw(self):
+        return ImageDraw.Draw(self.buffer)
+
+    def clear(self, color=(0, 0, 0)):
+        self.buffer.paste(color, (0, 0, self.width, self.height))
+
+class RGB565Buffer:
+    # the frame in the big endian RGB565 format of the ILI9341. It follows the drawn image only
+    # where widgets painted, so a flush never converts the whole frame
+    def __init__(self, size):
+        self.width, self.height = size
+        self.data = bytearray(self.width * self.height * 2)
+        self.pixels = np.frombuffer(self.data, dtype='>u2').reshape(self.height, self.width)
+
+    def update(self, image, box):
+        x0, y0, x1, y1 = box
+        rgb = np.asarray(image.crop(box), dtype=np.uint16)
+        self.pixels[y0:y1, x0:x1] = ((rgb[..., 0] & 0xF8) << 8) | ((rgb[..., 1] & 0xFC) << 3) | (rgb[..., 2] >> 3)
+
+    def window(self, box):
+        # the bytes of a box in the order the panel expects them. A box of full rows is a view of the buffer,
+        # the rows of a narrower box are copied to lie back to back
+        x0, y0, x1, y1 = box
+        if x0 == 0 and x1 == self.width:
+            return memoryview(self.data)[y0 * self.width * 2:y1 * self.width * 2]
+        return memoryview(self.pixels[y0:y1, x0:x1].tobytes())
+
+class SwapChain:
+    # front and back RGB565 buffers. The render thread converts a finished frame into the back buffer
+    # while the transmit thread still sends the front one, then the two are swapped. Without a
+    # transmit thread every frame is sent right away by the thread presenting it.
+
+    def __init__(self, size, send):
+        # send(buffer, box) transmits a box of a RGB565Buffer
+        self.send = send
+        self.front = RGB565Buffer(size)
+        self.back = RGB565Buffer(size)
+        # boxes that changed while the back buffer was the front one
+        self.stale = []
+        self.condition = threading.Condition()
+        self.pending = None
+        self.transmitting = False
+        self.running = False
+        self.thread = None
+
+        self.frames = 0
+        self.last_transmit_time = 0
+        self.max_transmit_time = 0
+        self.total_wait_time = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='transmit', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+    def present(self, image, boxes, windows):
+        # boxes changed in the image, windows are the boxes to send for them
+        for box in self.stale + boxes:
+            self.back.update(image, box)
+        self.stale = boxes
+
+        start = time.monotonic()
+        with self.condition:
+            # the front buffer can only be replaced once it was sent completely
+            while self.running and (self.transmitting or self.pending is not None):
+                self.condition.wait()
+            self.front, self.back = self.back, self.front
+            wait_time = time.monotonic() - start
+            self.total_wait_time += wait_time
+            metrics.histogram('dryer_swap_wait_seconds').observe(wait_time)
+            if self.running:
+                self.pending = windows
+                self.condition.notify_all()
+                return
+        self.transmit(self.front, windows)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                windows, self.pending = self.pending, None
+                self.transmitting = True
+                buffer = self.front
+            self.transmit(buffer, windows)
+            with self.condition:
+                self.transmitting = False
+                self.condition.notify_all()
+
+    def transmit(self, buffer, windows):
+        start = time.monotonic()
+        for box in windows:
+            self.send(buffer, box)
+        duration = time.monotonic() - start
+        metrics.histogram('dryer_spi_transmit_seconds').observe(duration)
+        metrics.counter('dryer_spi_bytes_total').inc(sum(2 * (x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in windows))
+        self.frames += 1
+        self.last_transmit_time = duration
+        self.max_transmit_time = max(self.max_transmit_time, duration)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'frames': self.frames,
+                'last_transmit_time': self.last_transmit_time,
+                'max_transmit_time': self.max_transmit_time,
+                'total_wait_time': self.total_wait_time,
+            }
@@ -1,5 +1,4 @@
 import datetime
-import threading
 
 from RPi import GPIO
 from time import sleep
@@ -113,13 +112,20 @@ class Beeper(IO):
     LONG_BEEP_DURATIUON = 1.0
     SHORT_BEEP_DURATIUON = 0.1
 
-    def __init__(self, pin):
-            return super().__init__(pin)
+    def __init__(self, pin, scheduler):
+            super().__init__(pin)
+            self.scheduler = scheduler
+            self.off_job = None
 
-    def long_beep(self):
+    def beep(self, duration):
+        # a new beep extends a running one instead of being cut short by its end
+        if self.off_job is not None:
+            self.off_job.cancel()
         self.on()
-        threading.Timer(Beeper.LONG_BEEP_DURATIUON, self.off).start()
+        self.off_job = self.scheduler.call_later(duration, self.off, name='beeper')
+
+    def long_beep(self):
+        self.beep(Beeper.LONG_BEEP_DURATIUON)
 
     def short_beep(self):
-        self.on()
-        threading.Timer(Beeper.SHORT_BEEP_DURATIUON, self.off).start()
\ No newline at end of file
+        self.beep(Beeper.SHORT_BEEP_DURATIUON)
\ No newline at end of file
@@ -0,0 +1,68 @@
+# input.py
+from collections import deque
+import time
+
+class InputQueue:
+    # encoder events from the GPIO threads, handled on the render thread right before the next frame.
+    # A deque needs no lock for appending on one end and popping on the other, consecutive turns are
+    # summed up to a net delta so a fast spin costs a single frame.
+
+    # detents closer together than this many seconds count this many steps when editing values
+    ACCELERATION = ((0.03, 5), (0.06, 3), (0.12, 2))
+
+    def __init__(self, notify, acceleration=True):
+        # notify is called after every event, e.g. to request a frame
+        self.notify = notify
+        self.acceleration = acceleration
+        self.events = deque()
+        self.last_turn = None
+        self.last_direction = 0
+
+        self.turns = 0
+        self.dispatched = 0
+
+    def turn(self, direction):
+        # direction is 1 for a clockwise detent and -1 for a counter clockwise one
+        now = time.monotonic()
+        factor = 1
+        if self.acceleration and direction == self.last_direction:
+            interval = now - self.last_turn
+            for limit, steps in InputQueue.ACCELERATION:
+                if interval < limit:
+                    factor = steps
+                    break
+        self.last_turn = now
+        self.last_direction = direction
+        self.turns += 1
+        self.events.append(('turn', direction, direction * factor))
+        self.notify()
+
+    def click(self):
+        self.events.append(('click',))
+        self.notify()
+
+    def long_click(self):
+        self.events.append(('long_click',))
+        self.notify()
+
+    def drain(self):
+        # the events since the last call in order, runs of turns are merged into ('turn', steps, accelerated_steps)
+        events = []
+        while True:
+            try:
+                event = self.events.popleft()
+            except IndexError:
+                break
+            if event[0] == 'turn' and len(events) > 0 and events[-1][0] == 'turn':
+                events[-1] = ('turn', events[-1][1] + event[1], events[-1][2] + event[2])
+            else:
+                events.append(event)
+        self.dispatched += len(events)
+        return events
+
+    def stats(self):
+        return {
+            'turns': self.turns,
+            'dispatched': self.dispatched,
+            'pending': len(self.events),
+        }
@@ -0,0 +1,114 @@
+# metrics.py
+import bisect
+import math
+import os
+import threading
+
+# upper bounds in seconds of the latency histograms, roughly 2.5x apart from 100us to 10s
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# every metric the app records, exported with this help text
+DESCRIPTIONS = {
+    'dryer_frame_seconds': ('histogram', 'time to draw and present a frame'),
+    'dryer_widget_draw_seconds': ('histogram', 'time to draw a widget, including the widgets it draws itself'),
+    'dryer_present_seconds': ('histogram', 'time to convert a frame and hand it to the transmit thread'),
+    'dryer_spi_transmit_seconds': ('histogram', 'time to send the damaged windows of a frame to the panel'),
+    'dryer_spi_bytes_total': ('counter', 'bytes sent to the panel'),
+    'dryer_swap_wait_seconds': ('histogram', 'time the render thread waited for the transmit thread'),
+    'dryer_dropped_frames_total': ('counter', 'frame slots lost to frames that took too long'),
+    'dryer_sensor_read_seconds': ('histogram', 'time a read of the sensor took'),
+    'dryer_sensor_failed_reads_total': ('counter', 'reads of the sensor without a result, each one is retried with the next interval'),
+    'dryer_sample_latency_seconds': ('histogram', 'time from reading a sample to acting on it, e.g. with the overtemperature check'),
+    'dryer_stale_samples_total': ('counter', 'samples that were too old to act on'),
+    'dryer_job_lateness_seconds': ('histogram', 'how late a scheduled job started'),
+    'dryer_job_seconds': ('histogram', 'time a scheduled job ran'),
+    'dryer_worker_seconds': ('histogram', 'time a piece of queued work ran on a worker thread'),
+}
+
+class Histogram:
+    # counts of observations per bucket with their sum, cheap enough to record on every frame
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+class Registry:
+    # the metrics by name and labels, created on first use
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def get(self, kind, name, labels):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            if DESCRIPTIONS[name][0] != kind:
+                raise ValueError('{} is a {}'.format(name, DESCRIPTIONS[name][0]))
+            with self.lock:
+                metric = self.metrics.setdefault(key, Histogram() if kind == 'histogram' else Counter())
+        return metric
+
+    def histogram(self, name, **labels):
+        return self.get('histogram', name, labels)
+
+    def counter(self, name, **labels):
+        return self.get('counter', name, labels)
+
+    def export(self):
+        # all metrics in the Prometheus text format
+        lines = []
+        with self.lock:
+            metrics = sorted(self.metrics.items(), key=lambda item: item[0])
+        exported = set()
+        for (name, labels), metric in metrics:
+            if name not in exported:
+                kind, description = DESCRIPTIONS[name]
+                lines.append('# HELP {} {}'.format(name, description))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                exported.add(name)
+            if isinstance(metric, Counter):
+                lines.append('{}{} {}'.format(name, format_labels(labels), metric.value))
+                continue
+            with metric.lock:
+                counts, count, total = list(metric.counts), metric.count, metric.sum
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append('{}_bucket{} {}'.format(name, format_labels(labels + (('le', le),)), cumulative))
+            lines.append('{}_sum{} {!r}'.format(name, format_labels(labels), total))
+            lines.append('{}_count{} {}'.format(name, format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # replaces the file at once, so a collector never reads half of it
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write(self.export())
+        os.replace(temporary, path)
+
+def format_labels(labels):
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in labels) + '}'
+
+# the metrics of the app, recorded from every thread
+metrics = Registry()
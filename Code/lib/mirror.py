@@ -0,0 +1,251 @@
+# mirror.py
+import hashlib
+import selectors
+import socket
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+class Viewer:
+    def __init__(self, connection):
+        self.connection = connection
+        # tiles the viewer hasn't got in their current state, a slow viewer only gets the latest state of a tile
+        self.dirty = set()
+        self.output = b''
+
+class FrameMirror:
+    # mirrors the panel to viewers over TCP. The render thread copies the damaged boxes of every frame,
+    # the mirror thread hashes the tiles they touch and sends the ones that really changed, compressed.
+    # Viewers drive the app by sending one byte per input, see INPUTS.
+    #
+    # The stream starts with HEADER, then every message is a tile count followed by that many TILEs,
+    # each with its zlib compressed big endian RGB565 pixels.
+
+    MAGIC = b'DRYM'
+    VERSION = 1
+    # magic, version, width, height, tile size
+    HEADER = struct.Struct('>4sBHHH')
+    MESSAGE = struct.Struct('>H')
+    # x, y, width, height and compressed length of a tile
+    TILE = struct.Struct('>HHHHI')
+    # most tiles in a message, a viewer falling behind is sent the rest with the next one
+    MAX_TILES = 256
+    INPUTS = {
+        ord('+'): lambda input: input.turn(1),
+        ord('-'): lambda input: input.turn(-1),
+        ord('c'): lambda input: input.click(),
+        ord('l'): lambda input: input.long_click(),
+    }
+
+    def __init__(self, size, host='127.0.0.1', port=5900, input=None, tile_size=32, max_viewers=4):
+        # only local viewers by default, e.g. through an SSH tunnel. input is the InputQueue viewers
+        # drive, None ignores their input
+        self.width, self.height = size
+        self.host = host
+        self.port = port
+        self.input = input
+        self.tile_size = tile_size
+        self.max_viewers = max_viewers
+        self.columns = -(-self.width // tile_size)
+        self.rows = -(-self.height // tile_size)
+
+        # copy of the frame, written by the render thread and read by the mirror thread under the lock
+        self.lock = threading.Lock()
+        self.pixels = np.zeros((self.height, self.width), dtype='>u2')
+        self.damaged = set(range(self.columns * self.rows))
+        self.hashes = [None] * (self.columns * self.rows)
+        self.compressed = [None] * (self.columns * self.rows)
+
+        self.viewers = {}
+        self.selector = None
+        self.listener = None
+        # the render thread wakes the mirror thread through this pair of sockets
+        self.wake_sender = None
+        self.wake_receiver = None
+        self.woken = False
+        self.running = False
+        self.thread = None
+
+        self.frames = 0
+        self.hashed_tiles = 0
+        self.changed_tiles = 0
+        self.sent_bytes = 0
+
+    def start(self):
+        # raises the error if the mirror can't listen, e.g. on a port that is in use
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.listener.bind((self.host, self.port))
+        except OSError:
+            self.listener.close()
+            raise
+        self.listener.listen(self.max_viewers)
+        self.listener.setblocking(False)
+        self.wake_receiver, self.wake_sender = socket.socketpair()
+        self.wake_receiver.setblocking(False)
+        self.wake_sender.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.selector.register(self.wake_receiver, selectors.EVENT_READ)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='mirror', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.wake()
+        self.thread.join()
+        for viewer in list(self.viewers.values()):
+            self.disconnect(viewer)
+        self.selector.close()
+        self.listener.close()
+        self.wake_sender.close()
+        self.wake_receiver.close()
+
+    def update(self, buffer, boxes):
+        # runs on the render thread after a frame was presented, buffer is the RGB565Buffer holding it
+        # and boxes are the damaged boxes on the panel
+        with self.lock:
+            for x0, y0, x1, y1 in boxes:
+                self.pixels[y0:y1, x0:x1] = buffer.pixels[y0:y1, x0:x1]
+                for row in range(y0 // self.tile_size, (y1 - 1) // self.tile_size + 1):
+                    for column in range(x0 // self.tile_size, (x1 - 1) // self.tile_size + 1):
+                        self.damaged.add(row * self.columns + column)
+            self.frames += 1
+            # without viewers the damage is only collected
+            wake = len(self.viewers) > 0 and not self.woken
+            self.woken = self.woken or wake
+        if wake:
+            self.wake()
+
+    def wake(self):
+        try:
+            self.wake_sender.send(b'\0')
+        except BlockingIOError:
+            # the mirror thread has a wake up pending anyway
+            pass
+
+    def tile_box(self, tile):
+        row, column = divmod(tile, self.columns)
+        x0, y0 = column * self.tile_size, row * self.tile_size
+        return x0, y0, min(x0 + self.tile_size, self.width), min(y0 + self.tile_size, self.height)
+
+    def process_damage(self):
+        # hash the damaged tiles and compress the ones that changed for every viewer
+        with self.lock:
+            damaged, self.damaged = self.damaged, set()
+            self.woken = False
+            tiles = []
+            for tile in damaged:
+                x0, y0, x1, y1 = self.tile_box(tile)
+                tiles.append((tile, self.pixels[y0:y1, x0:x1].tobytes()))
+        for tile, data in tiles:
+            self.hashed_tiles += 1
+            digest = hashlib.sha1(data).digest()
+            if digest == self.hashes[tile]:
+                continue
+            self.hashes[tile] = digest
+            # the fastest level, most of the panel is flat color that compresses well anyway
+            self.compressed[tile] = zlib.compress(data, 1)
+            self.changed_tiles += 1
+            for viewer in self.viewers.values():
+                viewer.dirty.add(tile)
+
+    def run(self):
+        while self.running:
+            for key, events in self.selector.select():
+                if key.fileobj is self.listener:
+                    self.accept()
+                elif key.fileobj is self.wake_receiver:
+                    try:
+                        while len(self.wake_receiver.recv(4096)) > 0:
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    viewer = self.viewers.get(key.fileobj)
+                    if viewer is None:
+                        continue
+                    if events & selectors.EVENT_READ:
+                        self.receive(viewer)
+                    if events & selectors.EVENT_WRITE and viewer.connection in self.viewers:
+                        self.send(viewer)
+            if len(self.viewers) > 0:
+                self.process_damage()
+            for viewer in self.viewers.values():
+                # only wait for a viewer to accept data while there is any for it
+                events = selectors.EVENT_READ
+                if len(viewer.output) > 0 or len(viewer.dirty) > 0:
+                    events |= selectors.EVENT_WRITE
+                self.selector.modify(viewer.connection, events)
+
+    def accept(self):
+        try:
+            connection, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        if len(self.viewers) >= self.max_viewers:
+            connection.close()
+            return
+        connection.setblocking(False)
+        viewer = Viewer(connection)
+        # a new viewer needs the whole frame
+        viewer.dirty = set(range(self.columns * self.rows))
+        viewer.output = memoryview(FrameMirror.HEADER.pack(FrameMirror.MAGIC, FrameMirror.VERSION, self.width, self.height, self.tile_size))
+        self.viewers[connection] = viewer
+        self.selector.register(connection, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def disconnect(self, viewer):
+        del self.viewers[viewer.connection]
+        self.selector.unregister(viewer.connection)
+        viewer.connection.close()
+
+    def receive(self, viewer):
+        try:
+            data = viewer.connection.recv(64)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if len(data) == 0:
+            self.disconnect(viewer)
+            return
+        if self.input is not None:
+            for byte in data:
+                action = FrameMirror.INPUTS.get(byte)
+                if action is not None:
+                    action(self.input)
+
+    def send(self, viewer):
+        if len(viewer.output) == 0:
+            tiles = sorted(viewer.dirty)[:FrameMirror.MAX_TILES]
+            viewer.dirty.difference_update(tiles)
+            parts = [FrameMirror.MESSAGE.pack(len(tiles))]
+            for tile in tiles:
+                x0, y0, x1, y1 = self.tile_box(tile)
+                parts.append(FrameMirror.TILE.pack(x0, y0, x1 - x0, y1 - y0, len(self.compressed[tile])))
+                parts.append(self.compressed[tile])
+            viewer.output = memoryview(b''.join(parts))
+        try:
+            sent = viewer.connection.send(viewer.output)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.disconnect(viewer)
+            return
+        viewer.output = viewer.output[sent:]
+        self.sent_bytes += sent
+
+    def stats(self):
+        return {
+            'viewers': len(self.viewers),
+            'frames': self.frames,
+            'hashed_tiles': self.hashed_tiles,
+            'changed_tiles': self.changed_tiles,
+            'sent_bytes': self.sent_bytes,
+        }
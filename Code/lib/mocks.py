@@ -1,6 +1,5 @@
 #mocks.py
 import numpy as np
-import pandas as pd
 
 class DHT22:
     def __init__(self):
@@ -12,12 +11,20 @@ class DHT22:
         return h, t
 
 class DHT22SampleVals:
-    def __init__(self):
+    def __init__(self, path='../FirstMeasurement/log.csv'):
+        # only the recorded samples need pandas
+        import pandas as pd
         self.sample = 0
-        self.data = pd.read_csv('../FirstMeasurement/log.csv', names=['Time', 'Humidity', 'Temperature'])
+        self.data = pd.read_csv(path, names=['Time', 'Humidity', 'Temperature'])
         self.data['Time'] = pd.to_datetime(self.data['Time'])
+        # mean seconds between two recorded samples, the pace to replay them at
+        duration = (self.data['Time'].iloc[-1] - self.data['Time'].iloc[0]).total_seconds()
+        self.interval = duration / (len(self.data) - 1) if len(self.data) > 1 else 2
         
     def read_retry(self, sensor_type, pin):
+        # after the end of the recording every read fails like one of the sensor
+        if self.sample >= len(self.data):
+            return None, None
         h,t = self.data['Humidity'][self.sample], self.data['Temperature'][self.sample]
         self.sample += 1 
         return h, t
@@ -38,4 +45,29 @@ class Beeper:
 
     def long_beep(self):
         print('Beep')
-        print('\a')
\ No newline at end of file
+        print('\a')
+
+class DryerPlant:
+    # a simple model of the chamber to tune the heater control off the device. The air approaches a temperature
+    # given by the heater power with a time constant, the sensor follows the air with a lag and the load
+    # dries twice as fast for every 10°C above the ambient temperature
+    def __init__(self, ambient=20.0, heater_rise=70.0, time_constant=900.0, sensor_lag=45.0, drying_time=120000.0):
+        self.ambient = ambient
+        self.heater_rise = heater_rise
+        self.time_constant = time_constant
+        self.sensor_lag = sensor_lag
+        self.drying_time = drying_time
+        self.air = ambient
+        self.sensor = ambient
+        self.moisture = 1.0
+
+    def step(self, dt, heater):
+        target = self.ambient + (self.heater_rise if heater else 0)
+        self.air += (target - self.air) * min(dt / self.time_constant, 1)
+        self.sensor += (self.air - self.sensor) * min(dt / self.sensor_lag, 1)
+        rate = 2 ** ((self.air - self.ambient) / 10) / self.drying_time
+        self.moisture -= self.moisture * min(rate * dt, 1)
+
+    def read(self):
+        # humidity and temperature with the resolution of the DHT22
+        return round(2 + 60 * self.moisture, 1), round(self.sensor, 1)
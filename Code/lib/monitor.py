@@ -0,0 +1,203 @@
+# monitor.py
+import asyncio
+import collections
+import json
+import threading
+
+from .metrics import metrics
+
+class MonitorServer:
+    # a small HTTP server to watch a process from the network, on its own thread and event loop.
+    # GET /status is the latest status as JSON, GET /events a Server-Sent-Events stream of the samples
+    # taken after connecting and GET /metrics the metrics of the app. The control loop only hands over
+    # snapshots with publish(), it never waits for a client.
+
+    # seconds between the comments that keep idle streams open and find dead clients
+    KEEPALIVE = 15
+    # seconds a client gets to send its request and the longest request accepted in bytes
+    REQUEST_TIMEOUT = 5
+    REQUEST_LIMIT = 4096
+    # bytes buffered for a client before writing to it waits
+    WRITE_BUFFER = 16384
+
+    STATUS_LINES = {
+        200: '200 OK',
+        400: '400 Bad Request',
+        404: '404 Not Found',
+        405: '405 Method Not Allowed',
+    }
+
+    def __init__(self, host='127.0.0.1', port=8080, max_clients=8, client_queue=64, history=256):
+        # only local clients by default, e.g. through an SSH tunnel. At most max_clients connections at a time,
+        # streams and requests alike, further ones are closed right away. A stream has at most client_queue
+        # events waiting to be sent, clients falling further behind are disconnected. They catch up from
+        # the last history events when they reconnect with the id of the last event they got
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.client_queue = client_queue
+        self.status = b'{"running": false}'
+        self.history = collections.deque(maxlen=history)
+        self.event_id = 0
+        # the event queues of the streaming clients and their writers
+        self.clients = {}
+        self.handlers = set()
+        self.running = False
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.started = threading.Event()
+        self.error = None
+
+        self.events = 0
+        self.dropped_clients = 0
+        self.rejected_clients = 0
+
+    def start(self):
+        # raises the error if the server can't listen, e.g. on a port that is in use
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, name='monitor', daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.error is not None:
+            raise self.error
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.accept, self.host, self.port, limit=MonitorServer.REQUEST_LIMIT))
+        except OSError as error:
+            self.error = error
+            self.loop.close()
+            return
+        finally:
+            self.started.set()
+        self.loop.run_forever()
+
+        self.server.close()
+        for task in self.handlers:
+            task.cancel()
+        if len(self.handlers) > 0:
+            self.loop.run_until_complete(asyncio.gather(*self.handlers, return_exceptions=True))
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    def publish(self, status, sample=None):
+        # status is a dict of the process, sample a dict of a new reading to stream. Safe to call from
+        # any thread, both must not be changed afterwards
+        if self.running:
+            self.loop.call_soon_threadsafe(self.dispatch, status, sample)
+
+    def dispatch(self, status, sample):
+        self.status = json.dumps(status).encode()
+        self.event_id += 1
+        name, data = ('status', self.status) if sample is None else ('sample', json.dumps(sample).encode())
+        event = 'id: {}\nevent: {}\ndata: '.format(self.event_id, name).encode() + data + b'\n\n'
+        self.history.append((self.event_id, event))
+        self.events += 1
+        for queue, writer in list(self.clients.items()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # the client can't keep up, the events are shared so it can't hold on to more memory
+                del self.clients[queue]
+                writer.transport.abort()
+                self.dropped_clients += 1
+
+    def accept(self, reader, writer):
+        # every connection counts from here on, also while its request is still being read
+        if len(self.handlers) >= self.max_clients:
+            self.rejected_clients += 1
+            writer.transport.abort()
+            return
+        task = self.loop.create_task(self.handle(reader, writer))
+        self.handlers.add(task)
+        task.add_done_callback(self.handlers.discard)
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), MonitorServer.REQUEST_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            lines = request.decode('latin-1').split('\r\n')
+            request_line = lines[0].split(' ')
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+
+            if len(request_line) != 3:
+                await self.respond(writer, 400, 'text/plain', b'bad request\n')
+            elif request_line[0] != 'GET':
+                await self.respond(writer, 405, 'text/plain', b'only GET is supported\n')
+            else:
+                path = request_line[1].split('?')[0]
+                if path == '/status':
+                    await self.respond(writer, 200, 'application/json', self.status)
+                elif path == '/events':
+                    await self.stream(writer, headers.get('last-event-id'))
+                elif path == '/metrics':
+                    await self.respond(writer, 200, 'text/plain; version=0.0.4', metrics.export().encode())
+                else:
+                    await self.respond(writer, 404, 'text/plain', b'not found\n')
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, content_type, body):
+        header = 'HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(
+            MonitorServer.STATUS_LINES[status], content_type, len(body))
+        writer.write(header.encode('latin-1') + body)
+        await writer.drain()
+
+    async def stream(self, writer, last_event_id):
+        # a reconnecting client gets the events it missed if the history still has all of them,
+        # everyone else starts with the current status
+        try:
+            last_event_id = int(last_event_id)
+        except (TypeError, ValueError):
+            last_event_id = None
+        if last_event_id is not None and len(self.history) > 0 and self.history[0][0] <= last_event_id + 1 <= self.event_id + 1:
+            backlog = [event for event_id, event in self.history if event_id > last_event_id]
+        else:
+            backlog = ['id: {}\nevent: status\ndata: '.format(self.event_id).encode() + self.status + b'\n\n']
+
+        # registered before the first await, so no event is missed between the backlog and the queue
+        queue = asyncio.Queue(self.client_queue)
+        self.clients[queue] = writer
+        try:
+            writer.transport.set_write_buffer_limits(high=MonitorServer.WRITE_BUFFER)
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n')
+            writer.write(b''.join(backlog))
+            await writer.drain()
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), MonitorServer.KEEPALIVE)
+                except asyncio.TimeoutError:
+                    event = b': keepalive\n\n'
+                if queue not in self.clients:
+                    # dropped for falling behind
+                    return
+                writer.write(event)
+                await writer.drain()
+        finally:
+            self.clients.pop(queue, None)
+
+    def stats(self):
+        return {
+            'clients': len(self.clients),
+            'events': self.events,
+            'dropped_clients': self.dropped_clients,
+            'rejected_clients': self.rejected_clients,
+        }
@@ -0,0 +1,92 @@
+# render.py
+import threading
+import time
+
+from .metrics import metrics
+
+class Renderer:
+    # draws the current screen on a single thread. State changes only mark the screen dirty,
+    # any number of them between two frames are coalesced into one draw and one flush.
+
+    def __init__(self, app, frame_time=0.033):
+        self.app = app
+        self.frame_time = frame_time
+        self.dirty = threading.Event()
+        self.running = False
+        self.thread = None
+        self.next_frame = 0
+
+        self.pending_invalidations = 0
+        self.invalidations = 0
+        self.coalesced = 0
+        self.frames = 0
+        self.dropped_frames = 0
+        self.total_frame_time = 0
+        self.last_frame_time = 0
+        self.max_frame_time = 0
+
+    def invalidate(self):
+        self.pending_invalidations += 1
+        self.dirty.set()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='renderer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.dirty.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        while self.running:
+            self.dirty.wait()
+            if not self.running:
+                break
+
+            # let further invalidations pile up until the next frame is due
+            delay = self.next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.dirty.clear()
+            self.render_frame()
+
+    def render_frame(self):
+        requests, self.pending_invalidations = self.pending_invalidations, 0
+
+        start = time.monotonic()
+        with self.app.lock:
+            self.app.dispatch_input()
+            damage = self.app.current_screen.draw()
+        if len(damage) > 0:
+            present_start = time.monotonic()
+            self.app.present(damage)
+            metrics.histogram('dryer_present_seconds').observe(time.monotonic() - present_start)
+        duration = time.monotonic() - start
+        metrics.histogram('dryer_frame_seconds').observe(duration)
+        self.next_frame = start + self.frame_time
+
+        self.invalidations += requests
+        self.coalesced += max(requests - 1, 0)
+        self.frames += 1
+        self.total_frame_time += duration
+        self.last_frame_time = duration
+        self.max_frame_time = max(self.max_frame_time, duration)
+        # every frame slot the render overran is lost
+        dropped = int(duration // self.frame_time)
+        self.dropped_frames += dropped
+        if dropped > 0:
+            metrics.counter('dryer_dropped_frames_total').inc(dropped)
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'invalidations': self.invalidations,
+            'coalesced': self.coalesced,
+            'dropped_frames': self.dropped_frames,
+            'last_frame_time': self.last_frame_time,
+            'average_frame_time': self.total_frame_time / self.frames if self.frames > 0 else 0,
+            'max_frame_time': self.max_frame_time,
+        }
@@ -0,0 +1,192 @@
+# runlog.py
+from functools import partial
+import os
+import time
+import numpy as np
+
+from .timeseries import to_timestamp
+
+# a run log is this magic followed by fixed width little endian records, nothing else
+MAGIC = b'DRYRUN01'
+RECORD = np.dtype([
+    ('timestamp', '<i8'),
+    ('humidity', '<f4'),
+    ('temperature', '<f4'),
+    ('heater', 'u1'),
+    ('reserved', 'u1', (7,)),
+])
+
+def run_path(directory, start):
+    return os.path.join(directory, '{:%Y%m%d-%H%M%S}.run'.format(start))
+
+class RunLog:
+    # append-only log of the readings of a run. Records are collected in memory and written in batches,
+    # the file is only synced every sync_interval seconds so the SD card isn't written for every sample.
+    # A crash loses at most the records of the last sync_interval.
+    # Writes, syncs and closing the file are queued on worker if there is one, appending never waits for the card.
+
+    def __init__(self, path, batch_size=64, sync_interval=60, worker=None):
+        self.path = path
+        self.submit = worker.submit if worker is not None else lambda callback: callback()
+        self.closed = False
+        self.sync_interval = sync_interval
+        self.batch = np.zeros(batch_size, dtype=RECORD)
+        self.pending = 0
+        self.records = 0
+        self.writes = 0
+        self.syncs = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # a log continued after a crash must not append behind a torn record
+        if os.path.exists(path) and os.path.getsize(path) > len(MAGIC):
+            records = (os.path.getsize(path) - len(MAGIC)) // RECORD.itemsize
+            os.truncate(path, len(MAGIC) + records * RECORD.itemsize)
+        # unbuffered, every batch is exactly one write
+        self.file = open(path, 'ab', buffering=0)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.last_sync = time.monotonic()
+
+    def append(self, now, humidity, temperature, heater):
+        record = self.batch[self.pending]
+        record['timestamp'] = to_timestamp(now)
+        record['humidity'] = np.nan if humidity is None else humidity
+        record['temperature'] = np.nan if temperature is None else temperature
+        record['heater'] = heater
+        self.pending += 1
+        self.records += 1
+
+        sync_due = time.monotonic() - self.last_sync >= self.sync_interval
+        if self.pending == len(self.batch) or sync_due:
+            self.write()
+        if sync_due:
+            self.sync()
+
+    def write(self):
+        if self.pending > 0:
+            # a copy, the batch is filled again before the worker wrote it
+            self.submit(partial(self.file.write, self.batch[:self.pending].tobytes()))
+            self.pending = 0
+            self.writes += 1
+
+    def sync(self):
+        self.submit(partial(os.fsync, self.file.fileno()))
+        self.last_sync = time.monotonic()
+        self.syncs += 1
+
+    def close(self):
+        if self.closed:
+            return
+        self.write()
+        self.sync()
+        self.submit(self.file.close)
+        self.closed = True
+
+# the index holds a summary and a preview of every run, so the history never has to read the logs
+INDEX_MAGIC = b'DRYIDX01'
+INDEX_NAME = 'runs.index'
+PREVIEW_POINTS = 256
+INDEX_RECORD = np.dtype([
+    ('name', 'S32'),
+    ('start', '<i8'),
+    ('end', '<i8'),
+    ('samples', '<i8'),
+    ('final_humidity', '<f4'),
+    ('final_temperature', '<f4'),
+    ('peak_temperature', '<f4'),
+    ('preview_points', '<i4'),
+    ('humidity', '<f4', (PREVIEW_POINTS,)),
+    ('temperature', '<f4', (PREVIEW_POINTS,)),
+])
+
+def map_records(path, magic, dtype):
+    # fixed width records after a magic mapped into memory, a record torn by a crash at the end is left out
+    with open(path, 'rb') as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError('{} is not a {} file'.format(path, magic.decode()))
+    count = (os.path.getsize(path) - len(magic)) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=len(magic), shape=(count,))
+
+def load_run(path):
+    return map_records(path, MAGIC, RECORD)
+
+def last_valid(series):
+    valid = series[~np.isnan(series)]
+    return valid[-1] if len(valid) > 0 else np.nan
+
+def preview(series, points=PREVIEW_POINTS):
+    # minimum and maximum of every bucket of samples, so the peaks survive that a subsample would miss
+    buckets = min(points // 2, len(series))
+    result = np.full(points, np.nan, dtype=np.float32)
+    if buckets == 0:
+        return result, 0
+    starts = np.linspace(0, len(series), buckets + 1).astype(np.int64)[:-1]
+    missing = np.isnan(series)
+    lows = np.minimum.reduceat(np.where(missing, np.inf, series), starts)
+    highs = np.maximum.reduceat(np.where(missing, -np.inf, series), starts)
+    lows = np.where(np.isinf(lows), np.nan, lows)
+    highs = np.where(np.isinf(highs), np.nan, highs)
+    # a falling bucket reaches its maximum first
+    ends = np.append(starts[1:], len(series)) - 1
+    falling = series[starts] > series[ends]
+    result[0:2 * buckets:2] = np.where(falling, highs, lows)
+    result[1:2 * buckets:2] = np.where(falling, lows, highs)
+    return result, 2 * buckets
+
+def summarize(name, records):
+    entry = np.zeros(1, dtype=INDEX_RECORD)[0]
+    humidity = records['humidity'].astype(np.float64)
+    temperature = records['temperature'].astype(np.float64)
+    entry['name'] = name.encode()
+    entry['start'] = records['timestamp'][0]
+    entry['end'] = records['timestamp'][-1]
+    entry['samples'] = len(records)
+    entry['final_humidity'] = last_valid(humidity)
+    entry['final_temperature'] = last_valid(temperature)
+    entry['peak_temperature'] = np.nanmax(temperature) if not np.isnan(temperature).all() else np.nan
+    entry['humidity'], entry['preview_points'] = preview(humidity)
+    entry['temperature'], _ = preview(temperature)
+    return entry
+
+class RunIndex:
+    # summaries of the logged runs in the order they were started, an entry is found by its position.
+    # The index is append-only like the logs, only runs newer than the last entry are ever added.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_NAME)
+        self.entries = self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return np.zeros(0, dtype=INDEX_RECORD)
+        return map_records(self.path, INDEX_MAGIC, INDEX_RECORD)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, position):
+        return self.entries[position]
+
+    def update(self):
+        # index the finished logs that are missing, run names sort by their start time
+        if not os.path.isdir(self.directory):
+            return 0
+        last = self.entries['name'][-1].decode() if len(self.entries) > 0 else ''
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith('.run') and name > last)
+        new_entries = [summarize(name, records) for name, records in
+                       ((name, load_run(os.path.join(self.directory, name))) for name in names) if len(records) > 0]
+        if len(new_entries) == 0:
+            return 0
+
+        with open(self.path, 'ab', buffering=0) as file:
+            if file.tell() == 0:
+                file.write(INDEX_MAGIC)
+            file.write(np.array(new_entries, dtype=INDEX_RECORD).tobytes())
+            os.fsync(file.fileno())
+        self.entries = self.load()
+        return len(new_entries)
@@ -0,0 +1,168 @@
+# scheduler.py
+import heapq
+import itertools
+import queue
+import threading
+import time
+import traceback
+
+from .metrics import metrics
+
+class Job:
+    # a callback due at a time, periodic jobs are due again every interval after they ran
+    def __init__(self, callback, when, interval, name):
+        self.callback = callback
+        self.when = when
+        self.interval = interval
+        self.name = name
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Scheduler:
+    # runs all timed outputs and periodic jobs of the app on one thread ordered by a heap of due times,
+    # instead of a thread or timer per job. Jobs must not block, they delay every job due after them.
+    # How late jobs start is recorded per job name.
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap = []
+        self.order = itertools.count()
+        self.running = False
+        self.thread = None
+        self.stats_by_name = {}
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name='scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # jobs that are due later are dropped, a running job is finished first
+        with self.condition:
+            self.running = False
+            self.heap = []
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def call_at(self, when, callback, name=None):
+        # when is a time.monotonic() timestamp
+        return self.schedule(Job(callback, when, None, name or getattr(callback, '__name__', 'job')))
+
+    def call_later(self, delay, callback, name=None):
+        return self.call_at(time.monotonic() + delay, callback, name)
+
+    def every(self, interval, callback, name=None, delay=None):
+        # run callback every interval seconds, first after delay which defaults to the interval
+        first = time.monotonic() + (interval if delay is None else delay)
+        return self.schedule(Job(callback, first, interval, name or getattr(callback, '__name__', 'job')))
+
+    def schedule(self, job):
+        with self.condition:
+            heapq.heappush(self.heap, (job.when, next(self.order), job))
+            self.condition.notify_all()
+        return job
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and (len(self.heap) == 0 or self.heap[0][0] > time.monotonic()):
+                    timeout = self.heap[0][0] - time.monotonic() if len(self.heap) > 0 else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                _, _, job = heapq.heappop(self.heap)
+            if not job.cancelled:
+                self.execute(job)
+
+    def execute(self, job):
+        start = time.monotonic()
+        lateness = start - job.when
+        try:
+            job.callback()
+        except Exception:
+            # a failing job must not take all the other jobs down with it
+            traceback.print_exc()
+
+        duration = time.monotonic() - start
+        metrics.histogram('dryer_job_lateness_seconds', job=job.name).observe(max(lateness, 0))
+        metrics.histogram('dryer_job_seconds', job=job.name).observe(duration)
+        with self.condition:
+            stats = self.stats_by_name.setdefault(job.name, {'runs': 0, 'total_lateness': 0, 'max_lateness': 0, 'max_duration': 0})
+            stats['runs'] += 1
+            stats['total_lateness'] += lateness
+            stats['max_lateness'] = max(stats['max_lateness'], lateness)
+            stats['max_duration'] = max(stats['max_duration'], duration)
+
+        if job.interval is not None and not job.cancelled:
+            # keep the cadence, but never try to catch up after a late run
+            job.when = max(job.when + job.interval, time.monotonic())
+            self.schedule(job)
+
+    def stats(self):
+        with self.condition:
+            return {
+                name: {
+                    'runs': stats['runs'],
+                    'average_lateness': stats['total_lateness'] / stats['runs'],
+                    'max_lateness': stats['max_lateness'],
+                    'max_duration': stats['max_duration'],
+                }
+                for name, stats in self.stats_by_name.items()
+            }
+
+class Worker:
+    # runs blocking work like writing to the SD card on its own thread in the order it was queued,
+    # so the jobs of the scheduler and the render thread only queue it
+
+    def __init__(self, name='worker'):
+        self.name = name
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # the work queued so far is done first
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def submit(self, callback):
+        # without a running thread the work is done right away
+        if self.thread is None:
+            self.execute(callback)
+        else:
+            self.queue.put(callback)
+
+    def wait(self):
+        # blocks until the work queued so far is done
+        if self.thread is not None:
+            self.queue.join()
+
+    def run(self):
+        while True:
+            callback = self.queue.get()
+            try:
+                if callback is None:
+                    return
+                self.execute(callback)
+            finally:
+                self.queue.task_done()
+
+    def execute(self, callback):
+        start = time.monotonic()
+        try:
+            callback()
+        except Exception:
+            traceback.print_exc()
+        metrics.histogram('dryer_worker_seconds', worker=self.name).observe(time.monotonic() - start)
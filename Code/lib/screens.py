@@ -1,13 +1,22 @@
 # screens.py
 import datetime
 import time
-from math import nan
-from threading import Thread
+from functools import partial
 import numpy as np
 
-from scipy.interpolate import UnivariateSpline
-
 from . import widgets
+from .eta import MODELS as ETA_MODELS
+from .runlog import RunLog, RunIndex, run_path, load_run
+from .checkpoint import Checkpoint
+from .control import PidController, TimeProportionalRelay, HeaterController
+from .timeseries import SampleSpan, to_timestamp, to_datetime
+from .utils import bounding_box, intersects
+from .metrics import metrics
+
+def timed_draw(widget, image):
+    start = time.perf_counter()
+    widget.draw(image)
+    metrics.histogram('dryer_widget_draw_seconds', widget=type(widget).__name__).observe(time.perf_counter() - start)
 
 class Screen:
     def __init__(self, display, display_size, main_widget, app):
@@ -22,7 +31,18 @@ class Screen:
         self.widget = main_widget(self.widget_size, app.theme)
         self.status_bar = widgets.StatusBar(self.status_bar_size, app.theme)
         
-        self.dialog = None
+        self._dialog = None
+        
+    @property
+    def dialog(self):
+        return self._dialog
+    
+    @dialog.setter
+    def dialog(self, dialog):
+        # closing a dialog uncovers the main widget
+        if dialog is None and self._dialog is not None:
+            self.widget.invalidate()
+        self._dialog = dialog
         
     def update_theme(self):
         self.widget.theme = self.app.theme
@@ -30,17 +50,30 @@ class Screen:
         if self.dialog is not None:
             self.dialog.theme = self.app.theme
         
+    def invalidate(self):
+        # request a new frame, the screen is drawn on the render thread
+        self.app.invalidate_display()
+        
     def draw(self):
+        # runs on the render thread with the app lock held, returns the damaged boxes
         # make sure the correct themes are selected
         self.update_theme()
+        # the icon follows the relay, with heater control it cycles during the process
+        self.status_bar.status['power'] = bool(self.app.heater)
+        
+        timed_draw(self.status_bar, self.display)
+        timed_draw(self.widget, self.display)
+        damage = self.status_bar.pop_damage() + self.widget.pop_damage()
         
-        self.status_bar.draw(self.display)
-        self.widget.draw(self.display)
         if self.dialog is not None:
-            self.dialog.draw(self.display)
-            
-        self.app.invalidate_display()
-        self.app.wait_for_display()
+            # the dialog has to be restored wherever the main widget painted over it
+            dialog_box = bounding_box(self.dialog.xy)
+            if any(intersects(box, dialog_box) for box in damage):
+                self.dialog.invalidate()
+            timed_draw(self.dialog, self.display)
+            damage += self.dialog.pop_damage()
+        
+        return damage
             
     def on_cwturn(self):
         pass
@@ -48,12 +81,21 @@ class Screen:
     def on_ccwturn(self):
         pass
     
+    def on_turn(self, steps, accelerated_steps):
+        # the net steps of the encoder since the last frame, positive is clockwise. Screens editing
+        # values may use the accelerated steps instead
+        for _ in range(abs(steps)):
+            if steps > 0:
+                self.on_cwturn()
+            else:
+                self.on_ccwturn()
+    
     def on_click(self):
         pass
     
     def switch_screen(self, new_screen):
         self.app.current_screen = new_screen(self.display, self.display_size, app=self.app)
-        self.app.current_screen.draw()
+        self.app.current_screen.invalidate()
 
     def create_dialog(self, title, left_btn, right_btn=None):
         self.dialog = widgets.Dialog((self.dialog_margin, 
@@ -82,11 +124,18 @@ class MainMenuScreen(Screen):
         self.widget.add_item('max. Runtime', 'resources/icons/time.png')
         self.widget.add_item('ETA', 'resources/icons/targettime.png')
         self.widget.add_item('Start Process', 'resources/icons/start.png', '>')
+        self.widget.add_item('History', 'resources/icons/time.png', '>')
         
         self.display_limits()
         
         self.editing_item = -1
         
+    def on_turn(self, steps, accelerated_steps):
+        # scrolling moves one item per detent, values are changed faster with fast turns
+        if self.editing_item != -1:
+            steps = accelerated_steps
+        super().on_turn(steps, steps)
+        
         
     def display_limits(self):
         self.widget.menu_items[0][2] = '{:03.1f}%'.format(self.app.target_humidity)
@@ -99,6 +148,9 @@ class MainMenuScreen(Screen):
             if self.widget.selected_item == 4:
                 self.switch_screen(ProgressScreen)
                 return
+            elif self.widget.selected_item == 5:
+                self.switch_screen(RunHistoryScreen)
+                return
             else:
                 self.editing_item = self.widget.selected_item
                 self.widget.edit_mode = True
@@ -106,7 +158,7 @@ class MainMenuScreen(Screen):
             self.widget.edit_mode = False
             self.editing_item = -1
 
-        self.draw()
+        self.invalidate()
         
     def on_cwturn(self):
         if self.editing_item == -1:
@@ -138,7 +190,7 @@ class MainMenuScreen(Screen):
                     self.app.set_eta += datetime.timedelta(minutes=15)
             
         self.display_limits()
-        self.draw()
+        self.invalidate()
         
     def on_ccwturn(self):
         if self.editing_item == -1:
@@ -169,20 +221,32 @@ class MainMenuScreen(Screen):
                 self.app.set_eta -= datetime.timedelta(minutes=15)
             
         self.display_limits()
-        self.draw()
+        self.invalidate()
         
 class ProgressScreen(Screen):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, resume=None, **kwargs):
         super().__init__(*args, **kwargs, main_widget=widgets.ProgressWidget)
         
         self.app.process_running = False
         self.is_waiting = False
         self.process_finished = False
-        self.widget.set_graphdata([datetime.datetime.now()], [nan], [nan])
         self.widget.set_targets(humidity=self.app.target_humidity, temperature=self.app.max_temperature)
-        self.temperatures = []
-        self.humidities = []
-        self.timestamps = []
+        # count and time span of the readings of the run
+        self.readings = SampleSpan()
+        self.eta_model = ETA_MODELS[self.app.eta_model]()
+        # the newest sample that went into the process
+        self.last_sequence = None
+        self.stale_samples = 0
+        self.run_log = None
+        # periodic jobs on the app's scheduler
+        self.updater = None
+        self.reader = None
+        self.waiting_since = None
+        self.heater = None
+        self.eta = None
+        self.last_reading = None
+        self.checkpoint = Checkpoint(self.app.run_directory) if self.app.run_directory is not None else None
+        self.last_checkpoint = 0
 
         # minimum number of sensor samples to collect before calculating an ETA
         self.minimum_eta_samples = 100
@@ -191,16 +255,19 @@ class ProgressScreen(Screen):
         # take a minimun number of samples before ending the process
         self.minimum_humid_samples = 10
         
-        if self.app.set_eta is None:
+        if resume is not None:
+            # continue a process that was interrupted
+            self.resume(resume)
+        elif self.app.set_eta is None:
             # start the process immediately
             self.start()
         else:
             # display a dialog how long the process will wait before starting
             self.create_dialog('Waiting...', 'Cancel', 'Start')
-            self.draw()
+            self.invalidate()
             self.is_waiting = True
 
-        Thread(target=self.screen_updater).start()
+        self.updater = self.app.scheduler.every(1, self.screen_updater, name='screen_updater')
         
     def on_click(self):
         if self.is_waiting:
@@ -211,7 +278,7 @@ class ProgressScreen(Screen):
                 self.is_waiting = False
                 self.dialog = None
                 self.start()
-                self.draw()
+                self.invalidate()
 
         if self.process_finished: 
             # process was finished, restart the app
@@ -222,113 +289,298 @@ class ProgressScreen(Screen):
             # process stopped, but dont restart the app yet, just hide the dialog
             self.process_finished = True
             self.dialog = None
-            self.draw()
+            self.invalidate()
 
         if self.dialog is None and self.app.process_running:
             # display a cancel dialog if the progress is running
             self.create_dialog('Cancel process?', 'No', 'Yes')
-            self.draw()
+            self.invalidate()
         elif self.dialog is not None and self.app.process_running:
             # when the dialog is already displayed, handle the choice
             if self.dialog.selected_button == 'left':
                 # Hide the dialog, continue Process
                 self.dialog = None
-                self.draw()
+                self.invalidate()
             else:
                 self.stop('Process canceled')
 
     def on_cwturn(self):
         if self.dialog is not None:
             self.dialog.select_next()
-            self.draw()
+            self.invalidate()
 
     def on_ccwturn(self):
         if self.dialog is not None:
             self.dialog.select_next()
-            self.draw()
+            self.invalidate()
             
-    def start(self):
+    def start(self, log_path=None):
         self.app.process_running = True
         self.is_waiting = False
-        self.app.heater_on()
-        self.status_bar.status['power'] = True
-        Thread(target=self.sensor_reader).start()
+        if self.app.run_directory is not None:
+            if log_path is None:
+                log_path = run_path(self.app.run_directory, datetime.datetime.now())
+            self.run_log = RunLog(log_path, worker=self.app.storage)
+            self.save_checkpoint()
+        if self.app.heater_control:
+            # the heater stays off until the first reading tells the controller how warm it is
+            relay = TimeProportionalRelay(self.switch_heater)
+            self.heater = HeaterController(PidController(self.app.max_temperature - self.app.temperature_margin), relay)
+        else:
+            self.app.heater_on()
+        self.waiting_since = time.monotonic()
+        self.reader = self.app.scheduler.every(self.app.intermeasurement_delay, self.sensor_reader, name='sensor_reader', delay=0)
+        self.publish()
+
+    def switch_heater(self, state):
+        # called by the relay of the heater controller, a new frame shows the state in the status bar
+        if state:
+            self.app.heater_on()
+        else:
+            self.app.heater_off()
+        self.invalidate()
 
     def stop(self, reason):
         self.app.process_running = False
         self.is_waiting = False
+        self.heater = None
         self.app.heater_off()
-        self.status_bar.status['power'] = False
+        if self.reader is not None:
+            self.reader.cancel()
+        if self.run_log is not None:
+            self.run_log.close()
+            self.run_log = None
+            # the process ended regularly, there is nothing to resume. Queued behind the last writes of the log
+            self.app.storage.submit(self.checkpoint.clear)
+            directory = self.app.run_directory
+            self.app.storage.submit(lambda: RunIndex(directory).update())
+        self.publish(reason=reason)
         self.create_dialog(reason, 'OK')
-        self.draw()
+        self.invalidate()
         self.app.notify_user()
 
+    def resume(self, state):
+        # rebuild the process from its checkpoint and the samples in its run log
+        self.app.target_humidity = state['target_humidity']
+        self.app.max_temperature = state['max_temperature']
+        self.app.max_runtime = datetime.timedelta(seconds=state['max_runtime'])
+        self.widget.set_targets(humidity=self.app.target_humidity, temperature=self.app.max_temperature)
+
+        records = load_run(state['log'])
+        timestamps = np.array(records['timestamp'])
+        values = np.column_stack((records['humidity'], records['temperature'])).astype(np.float64)
+        self.readings.extend_timestamps(timestamps)
+
+        if len(records) > 0:
+            self.widget.set_graphdata(timestamps, values[:, 0], values[:, 1])
+            self.last_reading = (to_datetime(timestamps[-1]), float(values[-1, 0]), float(values[-1, 1]))
+            # the estimator continues from the checkpoint with the samples that were logged after it.
+            # Checkpoints of another model or of version 1 are replayed from the start of the log
+            covered = 0
+            if state.get('eta_model') == self.app.eta_model and state['eta']['samples'] <= len(records):
+                covered = state['eta']['samples']
+                self.eta_model.restore(state['eta'])
+            # only the samples after the checkpoint go through the model, unless it has to start over
+            seconds = ((timestamps[covered:] - timestamps[0]) / 1e6).tolist()
+            for second, humidity in zip(seconds, values[covered:, 0].tolist()):
+                self.eta_model.add_sample(second, humidity)
+
+            # the time without power counts towards the runtime
+            if datetime.datetime.now() - self.readings.first_time >= self.app.max_runtime:
+                self.stop('Process Timeout')
+                self.checkpoint.clear()
+                return
+
+        self.start(log_path=state['log'])
+        self.invalidate()
+
+    def save_checkpoint(self):
+        # the log must hold every sample the checkpoint covers before it is saved, the storage worker
+        # writes and syncs the log first
+        self.run_log.write()
+        self.run_log.sync()
+        self.app.storage.submit(partial(self.checkpoint.save, {
+            'log': self.run_log.path,
+            'target_humidity': self.app.target_humidity,
+            'max_temperature': self.app.max_temperature,
+            'max_runtime': self.app.max_runtime.total_seconds(),
+            'eta_model': self.app.eta_model,
+            'eta': self.eta_model.state(),
+        }))
+        self.last_checkpoint = time.monotonic()
+
     def screen_updater(self):
-        while self.app.process_running or self.is_waiting:
-            time.sleep(1)
-            if len(self.timestamps) > 0:
-                self.timestamps[-1] = datetime.datetime.now()
-                self.widget.set_graphdata(self.timestamps, self.humidities, self.temperatures)
-
-            if self.is_waiting:
-                time_left = (self.app.set_eta.replace(microsecond=0) - datetime.datetime.now().replace(microsecond=0)) - self.app.max_runtime
-                self.dialog.title = "Waiting {}...".format(time_left)
-
-                if time_left <= datetime.timedelta(seconds = 0):
-                    self.dialog = None
-                    self.is_waiting = False
-                    self.app.notify_user()
-                    self.start()
-            
-            self.draw()
+        # runs every second while the process runs or waits for its start
+        if self.app.current_screen is not self or not (self.app.process_running or self.is_waiting):
+            self.updater.cancel()
+            return
+        with self.app.lock:
+            self.update_screen()
+
+    def update_screen(self):
+        if self.readings.count > 0:
+            # keep the runtime ticking between two readings without touching the graph
+            self.widget.set_runtime(datetime.datetime.now() - self.readings.first_time)
+
+        if self.is_waiting:
+            time_left = (self.app.set_eta.replace(microsecond=0) - datetime.datetime.now().replace(microsecond=0)) - self.app.max_runtime
+            self.dialog.title = "Waiting {}...".format(time_left)
+
+            if time_left <= datetime.timedelta(seconds = 0):
+                self.dialog = None
+                self.is_waiting = False
+                self.app.notify_user()
+                self.start()
+        
+        self.invalidate()
 
     def sensor_reader(self):
-        while self.app.process_running:
-            self.make_sensor_reading()
-            self.widget.set_graphdata(self.timestamps, self.humidities, self.temperatures)
-            time.sleep(self.app.intermeasurement_delay)
+        # runs every intermeasurement delay while the process runs, the sensor itself is read by the app's sensor worker
+        with self.app.lock:
+            if not self.app.process_running:
+                self.reader.cancel()
+                return
 
-            if len(self.timestamps) > self.minimum_eta_samples:
-                eta = self.get_eta()
+            new_reading = self.make_sensor_reading()
+            if new_reading:
+                self.waiting_since = time.monotonic()
+            elif time.monotonic() - self.waiting_since > self.app.sensor_timeout and self.app.process_running:
+                self.stop('Sensor failure!')
+            if self.heater is not None:
+                self.heater.update(time.monotonic())
+            if self.run_log is not None and time.monotonic() - self.last_checkpoint >= self.app.checkpoint_interval:
+                self.save_checkpoint()
+
+            # the prediction only changes with a new reading
+            if new_reading and self.readings.count > self.minimum_eta_samples:
+                self.eta = self.get_eta()
                 targets = {
-                    'time': eta, 
+                    'time': self.eta, 
                     'humidity': self.app.target_humidity, 
                     'temperature': self.app.max_temperature
                 }
                 self.widget.set_targets(**targets)
     
     def make_sensor_reading(self):
-        humid, temp = self.app.read_sensors()
-        self.temperatures.append(temp)
-        self.humidities.append(humid)
-        self.timestamps.append(datetime.datetime.now())
+        # process the latest sample if there is a new one, returns whether there was
+        sample = self.app.sensors.latest()
+        if sample is None or sample.sequence == self.last_sequence:
+            return False
+        self.last_sequence = sample.sequence
+        if sample.stale:
+            # too old to act on, the sensor is lagging behind
+            self.stale_samples += 1
+            metrics.counter('dryer_stale_samples_total').inc()
+            return False
+        metrics.histogram('dryer_sample_latency_seconds').observe((datetime.datetime.now() - sample.time).total_seconds())
+        self.process_reading(sample.time, sample.humidity, sample.temperature)
+        return True
+
+    def process_reading(self, now, humid, temp):
+        self.readings.append(now)
+        self.last_reading = (now, humid, temp)
+        if self.run_log is not None:
+            self.run_log.append(now, humid, temp, self.app.heater)
+        self.widget.append_sample(to_timestamp(now), humid, temp)
+        runtime = now - self.readings.first_time
+        self.eta_model.add_sample(runtime.total_seconds(), humid)
+        if self.heater is not None:
+            self.heater.measure(time.monotonic(), temp)
+        self.publish(sample={'time': now.isoformat(), 'humidity': humid, 'temperature': temp, 'heater': bool(self.app.heater)})
 
         if temp > self.app.max_temperature:
             self.stop('Overtemperature!')
 
-        if len(self.humidities) > self.minimum_humid_samples and humid <= self.app.target_humidity:
+        if self.readings.count > self.minimum_humid_samples and humid <= self.app.target_humidity:
             self.stop('Process Finished')
 
-        if self.app.max_runtime <= (self.timestamps[-1] - self.timestamps[0]):
+        if self.app.max_runtime <= runtime:
             self.stop('Process Timeout')
 
+    def publish(self, sample=None, reason=None):
+        # the state of the process for the monitor server, sample is a new reading to stream
+        if self.app.monitor is None:
+            return
+        status = {
+            'running': self.app.process_running,
+            'reason': reason,
+            'heater': bool(self.app.heater),
+            'targets': {
+                'humidity': self.app.target_humidity,
+                'max_temperature': self.app.max_temperature,
+                'max_runtime': self.app.max_runtime.total_seconds(),
+            },
+            'started': self.readings.first_time.isoformat() if self.readings.count > 0 else None,
+            'samples': self.readings.count,
+            'reading': None,
+            'eta': self.eta.total_seconds() if self.eta is not None else None,
+        }
+        if self.last_reading is not None:
+            now, humid, temp = self.last_reading
+            status['reading'] = {'time': now.isoformat(), 'humidity': humid, 'temperature': temp}
+        self.app.publish_status(status, sample)
 
     def get_eta(self):
-        # fit a 3rd order polynomial to the data
-        timestamps = [(x - self.timestamps[0]).total_seconds() for x in self.timestamps]
-        # sample weight is less for older samples
-        weights = [x ** 2 for x in range(len(timestamps))]
-
-        coeffs = np.polyfit(timestamps, self.humidities, w=weights, deg=3)
-        poly = np.poly1d(coeffs)
-        # find where the polynomial intersects the target humidity
-        y0 = self.app.target_humidity
-        x0 = (poly - y0).roots
-        # filter complex solutions
-        x0 = x0[np.isreal(x0)]
-        if len(x0) > 0:
-            eta = datetime.timedelta(seconds=int(x0[0])) - (self.timestamps[-1].replace(microsecond=0) - self.timestamps[0].replace(microsecond=0))
-            if eta.total_seconds() > 0:
-                return eta
-
-        return None
\ No newline at end of file
+        # the time left until the model expects the target humidity
+        runtime = (self.readings.last_time - self.readings.first_time).total_seconds()
+        finish = self.eta_model.eta(self.app.target_humidity)
+        if finish is None or finish <= runtime:
+            return None
+        return datetime.timedelta(seconds=int(finish - runtime))
+
+class RunHistoryScreen(Screen):
+    # the logged runs newest first, behind an entry leading back to the menu
+    def __init__(self, *args, selected=0, **kwargs):
+        super().__init__(*args, **kwargs, main_widget=widgets.ListWidget)
+        
+        # the log of the last run may still be written
+        self.app.storage.wait()
+        self.index = RunIndex(self.app.run_directory) if self.app.run_directory is not None else None
+        if self.index is not None:
+            self.index.update()
+        runs = len(self.index) if self.index is not None else 0
+        self.widget.set_items(runs + 1, self.describe)
+        self.widget.select(selected)
+        
+    def run_position(self, item):
+        # the position in the index of a list item, the list starts with the newest run
+        return len(self.index) - item
+        
+    def describe(self, item):
+        if item == 0:
+            return 'Back', '{} runs'.format(self.widget.item_count - 1)
+        entry = self.index[self.run_position(item)]
+        duration = datetime.timedelta(seconds=int((entry['end'] - entry['start']) // 1000000))
+        details = '{}  RH {:03.1f}%  max {:03.1f}°C'.format(duration, entry['final_humidity'], entry['peak_temperature'])
+        return '{:%d.%m.%Y %H:%M}'.format(to_datetime(entry['start'])), details
+        
+    def on_click(self):
+        if self.widget.selected_item == 0:
+            self.switch_screen(MainMenuScreen)
+        else:
+            self.switch_screen(partial(RunGraphScreen, index=self.index, item=self.widget.selected_item))
+        
+    def on_cwturn(self):
+        self.widget.scroll_down()
+        self.invalidate()
+        
+    def on_ccwturn(self):
+        self.widget.scroll_up()
+        self.invalidate()
+        
+class RunGraphScreen(Screen):
+    # the graph of a logged run from the preview in the index, the log itself isn't read
+    def __init__(self, *args, index, item, **kwargs):
+        super().__init__(*args, **kwargs, main_widget=widgets.ProgressWidget)
+        
+        self.item = item
+        entry = index[len(index) - item]
+        points = entry['preview_points']
+        timestamps = np.linspace(entry['start'], entry['end'], points).astype(np.int64)
+        self.widget.set_graphdata(timestamps, entry['humidity'][:points].astype(np.float64), entry['temperature'][:points].astype(np.float64))
+        self.widget.humidity = float(entry['final_humidity'])
+        self.widget.temperature = float(entry['final_temperature'])
+        self.widget.set_targets(temperature=float(entry['peak_temperature']))
+        
+    def on_click(self):
+        self.switch_screen(partial(RunHistoryScreen, selected=self.item))
@@ -0,0 +1,105 @@
+# sensors.py
+from collections import namedtuple
+import datetime
+import sys
+import threading
+import time
+import traceback
+
+from .metrics import metrics
+
+# a reading of the sensor, stale once it is older than the max_age of the worker
+Sample = namedtuple('Sample', 'time humidity temperature sequence stale')
+
+class SensorWorker:
+    # reads the sensor on its own thread with a steady interval and publishes the latest sample,
+    # so nobody else ever waits for the sensor no matter how long a read takes
+
+    def __init__(self, read, interval, max_age):
+        # read returns (humidity, temperature), either may be None for a failed read
+        self.read = read
+        self.interval = interval
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+        self.sample = None
+        self.sampled_at = None
+        self.sequence = 0
+
+        self.reads = 0
+        self.failed_reads = 0
+        # the last error of read, printed only when it changes
+        self.last_error = None
+        self.last_read_time = 0
+        self.max_read_time = 0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='sensors', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        next_read = time.monotonic()
+        while self.running:
+            start = time.monotonic()
+            try:
+                humidity, temperature = self.read()
+                self.last_error = None
+            except Exception:
+                # a driver error is a failed read like any other, the worker keeps sampling. The same
+                # error over and over is only printed once
+                error = traceback.format_exc()
+                if error != self.last_error:
+                    print(error, end='', file=sys.stderr)
+                    self.last_error = error
+                humidity, temperature = None, None
+            duration = time.monotonic() - start
+            metrics.histogram('dryer_sensor_read_seconds').observe(duration)
+
+            with self.lock:
+                self.reads += 1
+                self.last_read_time = duration
+                self.max_read_time = max(self.max_read_time, duration)
+                if humidity is None or temperature is None:
+                    self.failed_reads += 1
+                    metrics.counter('dryer_sensor_failed_reads_total').inc()
+                else:
+                    self.sequence += 1
+                    self.sample = Sample(datetime.datetime.now(), humidity, temperature, self.sequence, False)
+                    self.sampled_at = time.monotonic()
+
+            # keep the cadence, but never try to catch up after a slow read
+            next_read = max(next_read + self.interval, time.monotonic())
+            delay = next_read - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def latest(self):
+        # the newest sample or None if there was no successful read yet
+        with self.lock:
+            if self.sample is None:
+                return None
+            return self.sample._replace(stale=self.age() > self.max_age)
+
+    def age(self):
+        # seconds since the last successful read
+        if self.sampled_at is None:
+            return float('inf')
+        return time.monotonic() - self.sampled_at
+
+    def stats(self):
+        with self.lock:
+            return {
+                'reads': self.reads,
+                'failed_reads': self.failed_reads,
+                'last_read_time': self.last_read_time,
+                'max_read_time': self.max_read_time,
+                'sample_age': self.age(),
+            }
@@ -0,0 +1,48 @@
+# timeseries.py
+import datetime
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+def to_timestamp(time):
+    # naive local datetimes to microseconds, stored as int64
+    return (time - EPOCH) // MICROSECOND
+
+def to_datetime(timestamp):
+    return EPOCH + datetime.timedelta(microseconds=int(timestamp))
+
+class SampleSpan:
+    # how many readings a run has and when the first and the last one was taken. The readings themselves
+    # are only kept by the run log and, decimated to the pixels, by the graph
+
+    def __init__(self):
+        self.count = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def append(self, time):
+        self.append_timestamp(to_timestamp(time))
+
+    def append_timestamp(self, timestamp):
+        # like append, with the time already in microseconds
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        self.count += 1
+
+    def extend_timestamps(self, timestamps):
+        # like append_timestamp for every timestamp of an array, e.g. the samples of a run log
+        if len(timestamps) == 0:
+            return
+        if self.first_timestamp is None:
+            self.first_timestamp = int(timestamps[0])
+        self.last_timestamp = int(timestamps[-1])
+        self.count += len(timestamps)
+
+    @property
+    def first_time(self):
+        return to_datetime(self.first_timestamp)
+
+    @property
+    def last_time(self):
+        return to_datetime(self.last_timestamp)
@@ -1,35 +1,188 @@
 # utils.py
-from PIL import Image, ImageDraw, ImageFont, ImageOps
+from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageOps
+from math import floor, ceil
+from collections import OrderedDict
 
-def draw_rotated_text(image, text, position, angle, font, fill=(255,255,255)):
+class SpriteCache:
+    # bounded LRU cache of rendered and rotated texts, ready to be pasted. Only the render thread
+    # draws widgets, so it isn't locked
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, font, fill, angle):
+        key = (text, font, fill, angle)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            self.hits += 1
+            return sprite
+        self.misses += 1
+
+        sprite = render_rotated_text(text, font, fill, angle)
+        self.sprites[key] = sprite
+        while len(self.sprites) > self.max_size:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    def clear(self):
+        self.sprites.clear()
+
+text_sprites = SpriteCache(128)
+
+class LayerCache:
+    # bounded LRU cache of painted widgets by their state, limited by the bytes of the bitmaps. Like
+    # the text sprites it is only used by the render thread, drawing and switching the theme
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.layers = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        layer = self.layers.get(key)
+        if layer is None:
+            self.misses += 1
+            return None
+        self.layers.move_to_end(key)
+        self.hits += 1
+        return layer
+
+    def put(self, key, layer):
+        if key in self.layers:
+            self.size -= layer_bytes(self.layers.pop(key))
+        self.layers[key] = layer
+        self.size += layer_bytes(layer)
+        while self.size > self.max_bytes and len(self.layers) > 1:
+            self.size -= layer_bytes(self.layers.popitem(last=False)[1])
+
+    def clear(self):
+        self.layers.clear()
+        self.size = 0
+
+    def discard_theme(self, theme):
+        # drop the layers painted with a theme, keys start with the name of its class
+        for key in [key for key in self.layers if key[0] == theme]:
+            self.size -= layer_bytes(self.layers.pop(key))
+
+def layer_bytes(layer):
+    return layer.width * layer.height * len(layer.getbands())
+
+widget_layers = LayerCache(4 * 1024 * 1024)
+
+def render_rotated_text(text, font, fill, angle):
     # Get rendered font width and height.
-    context = image.draw()
-    width, height = context.textsize(text, font=font)
+    width, height = font.getsize(text)
     # Create a new image with transparent background to store the text.
     textimage = Image.new('RGBA', (width, height), (0,0,0,0))
     # Render the text.
     textdraw = ImageDraw.Draw(textimage)
     textdraw.text((0,0), text, font=font, fill=fill)
     # Rotate the text image.
-    rotated = textimage.rotate(angle, expand=1)
+    return textimage.rotate(angle, expand=1)
+
+def draw_rotated_text(image, text, position, angle, font, fill=(255,255,255)):
+    rotated = text_sprites.get(text, font, fill, angle)
     # Paste the text into the image, using it as a mask for transparency.
     position = tuple(int(x) for x in position)
     image.buffer.paste(rotated, position, rotated)
     
-def draw_rotated_text_centered(image, text, xy, font, color):
-    context = image.draw()
-    size = context.textsize(text, font)
-    draw_rotated_text(image, text, (xy[0], xy[1] - size[0] / 2), -90, font, color)
+def draw_rotated_text_centered(image, text, xy, font, color, clip=None):
+    # clip is a list of boxes in image coordinates, the text is only painted inside them
+    rotated = text_sprites.get(text, font, color, -90)
+    # the text runs along the y axis after the rotation
+    position = (int(xy[0]), int(xy[1] - rotated.height / 2))
+    mask = rotated
+    if clip is not None:
+        # a mask of the size of the text, not of the image
+        clip_mask = Image.new('L', rotated.size, 0)
+        context = ImageDraw.Draw(clip_mask)
+        for x0, y0, x1, y1 in clip:
+            context.rectangle((x0 - position[0], y0 - position[1], x1 - 1 - position[0], y1 - 1 - position[1]), fill=255)
+        mask = ImageChops.multiply(rotated.split()[3], clip_mask)
+    image.buffer.paste(rotated, position, mask)
     
+class Icon:
+    # an icon together with its variants for the themes, each computed once on first use
+
+    def __init__(self, image):
+        self.image = image
+        self.variants = {False: image}
+
+    @property
+    def width(self):
+        return self.image.width
+
+    @property
+    def height(self):
+        return self.image.height
+
+    def variant(self, theme):
+        image = self.variants.get(theme.INVERT_ICONS)
+        if image is None:
+            image = invert_image(self.image)
+            self.variants[theme.INVERT_ICONS] = image
+        return image
+
+# icons by file, screens share them instead of loading them again
+icons = {}
+
+def invert_image(image):
+    inverted = ImageOps.invert(image.convert('RGB'))
+    _, _, _, a = image.split()
+    r, g, b = inverted.split()
+    return Image.merge('RGBA', (r, g, b, a))
+
 def load_image(image_file, theme):
-    image = Image.open(image_file).rotate(-90).convert('RGBA')
-    return image
-
-def paste_image(target, image, position, theme):
-    if theme.INVERT_ICONS:
-        inverted = ImageOps.invert(image.convert('RGB'))
-        _, _, _, a = image.split()
-        r, g, b = inverted.split()
-        image =  Image.merge('RGBA', (r, g, b, a))
-        
-    target.buffer.paste(image, position, image)  
\ No newline at end of file
+    icon = icons.get(image_file)
+    if icon is None:
+        icon = Icon(Image.open(image_file).rotate(-90).convert('RGBA'))
+        icons[image_file] = icon
+    # prepare the variant for the current theme right away
+    icon.variant(theme)
+    return icon
+
+def paste_image(target, icon, position, theme):
+    image = icon.variant(theme)
+    target.buffer.paste(image, position, image)
+
+def bounding_box(xy):
+    # PIL draws rectangles including their end coordinates, boxes exclude them
+    return (int(floor(xy[0])), int(floor(xy[1])), int(ceil(xy[2])) + 1, int(ceil(xy[3])) + 1)
+
+def box_area(box):
+    return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+
+def intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def union_box(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def clip_box(box, size):
+    box = (max(box[0], 0), max(box[1], 0), min(box[2], size[0]), min(box[3], size[1]))
+    return box if box_area(box) > 0 else None
+
+def merge_boxes(boxes, overhead=0):
+    # join boxes as long as sending their bounding box is cheaper than sending them on their own,
+    # overhead is the cost of addressing an additional window in pixels
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                joined = union_box(boxes[i], boxes[j])
+                if box_area(joined) <= box_area(boxes[i]) + box_area(boxes[j]) + overhead:
+                    boxes[i] = joined
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
@@ -1,14 +1,178 @@
 # widgets.py
 from PIL import Image, ImageDraw
 import datetime
-from math import isnan
+from functools import partial
+from math import isnan, nan
+import numpy as np
 
-from .utils import load_image, draw_rotated_text, paste_image, draw_rotated_text_centered
+from .utils import load_image, draw_rotated_text, paste_image, draw_rotated_text_centered, bounding_box, intersects, union_box, widget_layers
+
+def finite_limits(series):
+    # minimum and maximum of a series ignoring missing readings, nan if there are none
+    finite = series[~np.isnan(series)]
+    if len(finite) == 0:
+        return nan, nan
+    return finite.min(), finite.max()
+
+class PlotSeries:
+    # minimum and maximum of a series per bucket of consecutive samples, so a polyline through them
+    # looks the same as through all samples. Samples are added one at a time and buckets double
+    # their size whenever there would be more of them than pixels to draw them on.
+    
+    def __init__(self, pixels):
+        self.pixels = pixels
+        self.load(np.array([]))
+        
+    def load(self, series):
+        # replace the content with a whole series at once
+        self.count = len(series)
+        self.minimum, self.maximum = finite_limits(series)
+        
+        self.bucket_size = 1
+        while -(-self.count // self.bucket_size) > self.pixels:
+            self.bucket_size *= 2
+        self.buckets = -(-self.count // self.bucket_size)
+        
+        padded = np.full(self.buckets * self.bucket_size, nan)
+        padded[:self.count] = series
+        padded = padded.reshape(self.buckets, self.bucket_size)
+        # missing readings must never be picked while a bucket has valid ones
+        missing = np.isnan(padded)
+        lowest = np.argmin(np.where(missing, np.inf, padded), axis=1)
+        highest = np.argmax(np.where(missing, -np.inf, padded), axis=1)
+        rows = np.arange(self.buckets)
+        
+        self.low_index = np.zeros(self.pixels, dtype=np.int64)
+        self.high_index = np.zeros(self.pixels, dtype=np.int64)
+        self.low = np.full(self.pixels, nan)
+        self.high = np.full(self.pixels, nan)
+        self.low_index[:self.buckets] = rows * self.bucket_size + lowest
+        self.high_index[:self.buckets] = rows * self.bucket_size + highest
+        self.low[:self.buckets] = padded[rows, lowest]
+        self.high[:self.buckets] = padded[rows, highest]
+        
+    def append(self, value):
+        bucket = self.count // self.bucket_size
+        if bucket == self.pixels:
+            self.compact()
+            bucket = self.count // self.bucket_size
+            
+        if bucket == self.buckets:
+            self.low_index[bucket] = self.high_index[bucket] = self.count
+            self.low[bucket] = self.high[bucket] = nan
+            self.buckets += 1
+            
+        # comparisons with nan are false, so the first valid value always wins
+        if not isnan(value):
+            if not value >= self.low[bucket]:
+                self.low[bucket] = value
+                self.low_index[bucket] = self.count
+            if not value <= self.high[bucket]:
+                self.high[bucket] = value
+                self.high_index[bucket] = self.count
+            if not value >= self.minimum:
+                self.minimum = value
+            if not value <= self.maximum:
+                self.maximum = value
+        self.count += 1
+        
+    def compact(self):
+        # merge neighbouring buckets into one of twice the size
+        pairs = self.buckets // 2
+        even, odd = slice(0, 2 * pairs, 2), slice(1, 2 * pairs, 2)
+        
+        lower = (self.low[odd] < self.low[even]) | np.isnan(self.low[even])
+        higher = (self.high[odd] > self.high[even]) | np.isnan(self.high[even])
+        self.low_index[:pairs] = np.where(lower, self.low_index[odd], self.low_index[even])
+        self.low[:pairs] = np.where(lower, self.low[odd], self.low[even])
+        self.high_index[:pairs] = np.where(higher, self.high_index[odd], self.high_index[even])
+        self.high[:pairs] = np.where(higher, self.high[odd], self.high[even])
+        
+        # an unpaired last bucket fits into the next merged one
+        if self.buckets % 2 == 1:
+            for array in (self.low_index, self.low, self.high_index, self.high):
+                array[pairs] = array[self.buckets - 1]
+            pairs += 1
+        self.buckets = pairs
+        self.bucket_size *= 2
+        
+    def points(self):
+        # sample indices and values of the polyline in order, two per bucket
+        low_first = self.low_index[:self.buckets] <= self.high_index[:self.buckets]
+        indices = np.empty(2 * self.buckets, dtype=np.int64)
+        values = np.empty(2 * self.buckets)
+        indices[0::2] = np.where(low_first, self.low_index[:self.buckets], self.high_index[:self.buckets])
+        indices[1::2] = np.where(low_first, self.high_index[:self.buckets], self.low_index[:self.buckets])
+        values[0::2] = np.where(low_first, self.low[:self.buckets], self.high[:self.buckets])
+        values[1::2] = np.where(low_first, self.high[:self.buckets], self.low[:self.buckets])
+        # missing readings leave a gap in the samples
+        valid = ~np.isnan(values)
+        return indices[valid], values[valid]
 
 class Widget:
     def __init__(self, xy, theme):
         self.xy = xy
-        self.theme = theme
+        self._theme = theme
+        
+        # whether the whole widget has to be painted on the next draw
+        self.needs_redraw = True
+        # the visible state of the last paint, widgets skip painting as long as it is unchanged
+        self.drawn_state = None
+        # boxes in display coordinates that were painted since the last flush
+        self.damage = []
+        
+    @property
+    def theme(self):
+        return self._theme
+    
+    @theme.setter
+    def theme(self, theme):
+        if theme is not self._theme:
+            self._theme = theme
+            self.invalidate()
+        
+    def invalidate(self):
+        self.needs_redraw = True
+        
+    def is_outdated(self, state):
+        # check if the widget looks different for the given state and remember it as painted
+        if self.needs_redraw or state != self.drawn_state:
+            self.drawn_state = state
+            self.needs_redraw = False
+            return True
+        return False
+        
+    def draw_retained(self, image, state, paint):
+        # for widgets painting their whole box from state alone. paint(image) paints the widget, the
+        # result is kept by state and a state painted before, e.g. a selection going back and forth,
+        # is only copied back into the image
+        if not self.is_outdated(state):
+            return
+        self.paste_layer(image, self.xy, paint, (type(self).__name__, state))
+        self.add_damage(self.xy)
+        
+    def draw_background(self, image, xy, paint, geometry=()):
+        # the static parts of a widget in the box xy, painted once per theme and geometry by paint(image)
+        # and copied into the image from then on. The dynamic parts are drawn over it
+        self.paste_layer(image, xy, paint, (type(self).__name__ + '.background', geometry))
+        
+    def paste_layer(self, image, xy, paint, key):
+        box = bounding_box(xy)
+        # the theme comes first, so the layers of a theme can be dropped together
+        key = (type(self.theme).__name__, box) + key
+        layer = widget_layers.get(key)
+        if layer is None:
+            paint(image)
+            widget_layers.put(key, image.buffer.crop(box))
+        else:
+            image.buffer.paste(layer, box[:2])
+
+    def add_damage(self, xy):
+        self.damage.append(bounding_box(xy))
+        
+    def pop_damage(self):
+        damage, self.damage = self.damage, []
+        return damage
         
     @property
     def width(self):
@@ -32,6 +196,10 @@ class StatusBar(Widget):
         self.power_icon = load_image('resources/icons/power.png', theme)
         
     def draw(self, image):
+        current_time = '{:%H:%M}'.format(datetime.datetime.now())
+        if not self.is_outdated((current_time, self.status['power'])):
+            return
+        
         context = image.draw()
         
         context.rectangle(self.xy, fill=self.theme.COLOR_BACKGROUND)
@@ -44,84 +212,107 @@ class StatusBar(Widget):
             paste_image(image, self.power_icon, (self.xy[0] + int(margin_x / 2), self.xy[1] + margin_y), self.theme)
         
         # draw the current time
-        current_time = '{:%H:%M}'.format(datetime.datetime.now())
         time_size = context.textsize(current_time, self.theme.FONT_REGULAR_BOLD)
         draw_rotated_text(image, current_time, (self.xy[0] + margin_x, (self.height) / 2 - time_size[0]/ 2), -90, self.theme.FONT_REGULAR_BOLD, self.theme.COLOR_PRIMARY)
+        self.add_damage(self.xy)
         
 class Graph(Widget):
+    # the legend ticks and labels reach this far left of the graph
+    LEGEND_OVERHANG = 8
+    LEGEND_WIDTH = 10
+    
     def __init__(self, xy, theme):
         super().__init__(xy, theme)
-        self.series = {'left': ([], theme.COLOR_HUMIDITY), 
-                        'right': ([], theme.COLOR_TEMPERATURE)}
-        self.legends = {'left': (0,0, theme.COLOR_HUMIDITY), 
-                        'right': (0,0, theme.COLOR_TEMPERATURE)}
+        # the legends take the space of the time axis on both ends
+        pixels = int(self.height - 2 * (Graph.LEGEND_WIDTH * 3 + 1))
+        self.series = {'left': (PlotSeries(pixels), theme.COLOR_HUMIDITY), 
+                        'right': (PlotSeries(pixels), theme.COLOR_TEMPERATURE)}
+        self.legends = {'left': ('n/a', 'n/a', theme.COLOR_HUMIDITY), 
+                        'right': ('n/a', 'n/a', theme.COLOR_TEMPERATURE)}
+        # decimated polylines of the series in display coordinates
+        self.lines = {}
 
+    @property
+    def outer_xy(self):
+        return (self.xy[0] - Graph.LEGEND_OVERHANG, self.xy[1], self.xy[2], self.xy[3])
     
     def set_series(self, side, series, color):
         if side not in ('left', 'right'):
             raise ValueError('Only "left" or "right" allowed for parameter side')
-        self.series[side] = ((series, color))
-        
-        lower_lim = min(series)
+        self.series[side][0].load(series)
+        self.set_color(side, color)
+        self.update_legend(side)
+        
+    def append(self, side, value):
+        plot = self.series[side][0]
+        limits = plot.minimum, plot.maximum
+        plot.append(value)
+        # the legend only has to be formatted again for new extrema
+        if (plot.minimum, plot.maximum) != limits:
+            self.update_legend(side)
+        self.lines.pop(side, None)
+        self.invalidate()
+        
+    def set_color(self, side, color):
+        plot, old_color = self.series[side]
+        if color != old_color:
+            self.series[side] = (plot, color)
+            self.legends[side] = self.legends[side][:2] + (color,)
+            self.invalidate()
+        
+    def update_legend(self, side):
+        plot, color = self.series[side]
+        lower_lim, upper_lim = plot.minimum, plot.maximum
         if isnan(lower_lim):
             lower_lim = 'n/a'
         else:
             lower_lim = '{:03.1f}'.format(lower_lim)
             
-        upper_lim = max(series)
         if isnan(upper_lim):
             upper_lim = 'n/a'
         else:
             upper_lim = '{:03.1f}'.format(upper_lim)
         self.legends[side] = (lower_lim, upper_lim, color)
+        self.lines.pop(side, None)
+        self.invalidate()
+        
+    def plot_line(self, plot, legend_margin_x, legend_margin_y, legend_width_top):
+        y_values, x_values = plot.points()
+        if len(x_values) == 0:
+            return []
+        
+        # the scales follow the running extrema and sample count
+        min_x, max_x = plot.minimum, plot.maximum
+        min_y, max_y = 0, plot.count
+        
+        if (max_x - min_x) != 0:
+            scale_x = (self.width - (legend_margin_x + legend_width_top)) / (max_x - min_x)
+        else:
+            scale_x = 1
+            
+        if (max_y - min_y) != 0:
+            scale_y = (self.height - (legend_margin_y * 2)) / (max_y - min_y)
+        else:
+            scale_y = 1
+        
+        offset_x = self.xy[0] + legend_margin_x - (min_x * scale_x)
+        offset_y = self.xy[1] + legend_margin_y
         
-    def set_yaxis(self, data):
-        self.yaxis = data 
+        return list(zip((x_values * scale_x + offset_x).tolist(), (y_values * scale_y + offset_y).tolist()))
     
-    def draw(self, image):
+    def paint_background(self, image):
         context = image.draw()
-        # Draw a background for the graph
-        context.rectangle(self.xy, fill=self.theme.COLOR_BACKGROUND)
+        # Draw a background for the graph including the legend overhang
+        context.rectangle(self.outer_xy, fill=self.theme.COLOR_BACKGROUND)
         
-        legend_width = 10
+        legend_width = Graph.LEGEND_WIDTH
         legend_width_top = legend_width / 2
         legend_width_bottom = 0
         legend_width_lr = legend_width * 3
         legend_tick_length = legend_width / 4
         
-        legend_margin_x = legend_width_bottom + 1
-        legend_margin_y = legend_width_lr + 1
-        
-        line_width = 2
-        
         legend_color = self.theme.COLOR_PRIMARY
         
-        legend_font = self.theme.FONT_LEGEND
-        
-        # draw the data lines
-        for line_data, line_color in self.series.values():
-            x_values = line_data
-            y_values = list(range(len(self.yaxis)))
-            
-            min_x, max_x = min(x_values), max(x_values)
-            min_y, max_y = 0, len(y_values)
-            
-            if (max_x - min_x) != 0:
-                scale_x = (self.width - (legend_margin_x + legend_width_top)) / (max_x - min_x)
-            else:
-                scale_x = 1
-                
-            if (max_y - min_y) != 0:
-                scale_y = (self.height - (legend_margin_y * 2)) / (max_y - min_y)
-            else:
-                scale_y = 1
-            
-            offset_x = self.xy[0] + legend_margin_x - (min_x * scale_x)
-            offset_y = self.xy[1] + legend_margin_y
-            
-            line = [(xy[1] * scale_x + offset_x, xy[0] * scale_y + offset_y) for xy in zip(y_values, x_values)]
-            context.line(line, fill=line_color, width=line_width)
-            
         # draw the legend lines
         # left
         context.line((self.xy[0] + legend_width_bottom, self.xy[1] + legend_width_lr, 
@@ -163,7 +354,36 @@ class Graph(Widget):
         context.line((self.xy[0] + legend_width_bottom, self.xy[1] + self.height - legend_width_lr, 
                       self.xy[0] + legend_width_bottom - legend_tick_length, self.xy[1] + self.height - legend_width_lr),
                      fill=legend_color)
+
+    def draw(self, image):
+        context = image.draw()
+        # the axes and ticks only change with the theme, the data lines are drawn over them
+        self.draw_background(image, self.outer_xy, self.paint_background)
+        self.needs_redraw = False
+        self.add_damage(self.outer_xy)
         
+        legend_width = Graph.LEGEND_WIDTH
+        legend_width_top = legend_width / 2
+        legend_width_bottom = 0
+        legend_width_lr = legend_width * 3
+        legend_tick_length = legend_width / 4
+        
+        legend_margin_x = legend_width_bottom + 1
+        legend_margin_y = legend_width_lr + 1
+        
+        line_width = 2
+        
+        legend_font = self.theme.FONT_LEGEND
+        
+        # draw the data lines, their coordinates only change with new data
+        for side, (line_data, line_color) in self.series.items():
+            line = self.lines.get(side)
+            if line is None:
+                line = self.plot_line(line_data, legend_margin_x, legend_margin_y, legend_width_top)
+                self.lines[side] = line
+            if len(line) > 0:
+                context.line(line, fill=line_color, width=line_width)
+            
         # draw the legend texts
         # left lower bound
         llb = self.legends['left'][0]
@@ -195,28 +415,49 @@ class ProgressWidget(Widget):
         self.target_humidity = None
         self.target_temperature = None
         
+        self.start_timestamp = None
+        self.humidity = nan
+        self.temperature = nan
+        self.runtime = datetime.timedelta(0)
+        
+        # text boxes of the last paint by role
+        self.drawn_boxes = {}
+        
     def set_graphdata(self, timestamps, humidity, temperature):
-        # make sure the timestamps only have 1 second resolution
-        self.timestamps = [x.replace(microsecond=0) for x in timestamps]
+        # timestamps are in microseconds, the runtime only has 1 second resolution
+        self.start_timestamp = timestamps[0]
+        self.set_runtime(datetime.timedelta(seconds=int(timestamps[-1] // 1000000 - timestamps[0] // 1000000)))
+        self.humidity = humidity[-1]
+        self.temperature = temperature[-1]
+
+        self.graph.set_series('left', humidity, self.theme.COLOR_HUMIDITY)
+        self.graph.set_series('right', temperature, self.theme.COLOR_TEMPERATURE)
+        
+    def append_sample(self, timestamp, humidity, temperature):
+        # add a single reading, timestamp in microseconds like for set_graphdata
+        humidity = nan if humidity is None else humidity
+        temperature = nan if temperature is None else temperature
+        if self.start_timestamp is None:
+            self.start_timestamp = timestamp
+        self.set_runtime(datetime.timedelta(seconds=int(timestamp // 1000000 - self.start_timestamp // 1000000)))
         self.humidity = humidity
         self.temperature = temperature
-
-        self.graph.set_series('left', self.humidity, self.theme.COLOR_HUMIDITY)
-        self.graph.set_series('right', self.temperature, self.theme.COLOR_TEMPERATURE)
-        self.graph.set_yaxis(self.timestamps)
+        
+        self.graph.append('left', humidity)
+        self.graph.append('right', temperature)
+        
+    def set_runtime(self, runtime):
+        self.runtime = datetime.timedelta(seconds=int(runtime.total_seconds()))
         
     def set_targets(self, time=None, humidity=None, temperature=None):
         self.target_time = time
         self.target_humidity = humidity
         self.target_temperature = temperature
         
-    def draw(self, image):
-        context = image.draw()
-        self.graph.theme = self.theme
-        
-        context.rectangle(self.xy, fill=self.theme.COLOR_BACKGROUND)
+    def text_slots(self):
+        # all texts left of the graph as (text, position, font, color) by their role
+        slots = {}
         
-        # draw latest values as text
         text_y = 15
         time_x = (self.height) / 2
         humid_x = time_x - 110
@@ -225,30 +466,75 @@ class ProgressWidget(Widget):
         offset_limit_text = -13
         offset_title_text = 15
         
-        draw_rotated_text_centered(image, "RH:", (text_y + offset_title_text, humid_x), self.theme.FONT_REGULAR, self.theme.COLOR_HUMIDITY)
-        
-        humidity_string = 'n/a' if isnan(self.humidity[-1]) else '{:03.1f}%'.format(self.humidity[-1])
-        draw_rotated_text_centered(image, humidity_string, (text_y, humid_x), self.theme.FONT_BIG, self.theme.COLOR_HUMIDITY)
-        
+        slots['humidity_title'] = ("RH:", (text_y + offset_title_text, humid_x), self.theme.FONT_REGULAR, self.theme.COLOR_HUMIDITY)
+        humidity_string = 'n/a' if isnan(self.humidity) else '{:03.1f}%'.format(self.humidity)
+        slots['humidity'] = (humidity_string, (text_y, humid_x), self.theme.FONT_BIG, self.theme.COLOR_HUMIDITY)
         if self.target_humidity is not None:
             targethumidity_string = 'target: {:03.1f}%'.format(self.target_humidity)
-            draw_rotated_text_centered(image, targethumidity_string, (text_y + offset_limit_text, humid_x), self.theme.FONT_SMALL, self.theme.COLOR_HUMIDITY)
+            slots['humidity_target'] = (targethumidity_string, (text_y + offset_limit_text, humid_x), self.theme.FONT_SMALL, self.theme.COLOR_HUMIDITY)
         
-        draw_rotated_text_centered(image, "Temp:", (text_y + offset_title_text, temp_x), self.theme.FONT_REGULAR, self.theme.COLOR_TEMPERATURE)
-        temp_string = 'n/a' if isnan(self.temperature[-1]) else '{:03.1f}°C'.format(self.temperature[-1])
-        draw_rotated_text_centered(image, temp_string, (text_y, temp_x), self.theme.FONT_BIG, self.theme.COLOR_TEMPERATURE)
+        slots['temperature_title'] = ("Temp:", (text_y + offset_title_text, temp_x), self.theme.FONT_REGULAR, self.theme.COLOR_TEMPERATURE)
+        temp_string = 'n/a' if isnan(self.temperature) else '{:03.1f}°C'.format(self.temperature)
+        slots['temperature'] = (temp_string, (text_y, temp_x), self.theme.FONT_BIG, self.theme.COLOR_TEMPERATURE)
         if self.target_temperature is not None:
             targettemp_string = 'max: {:03.1f}°C'.format(self.target_temperature)
-            draw_rotated_text_centered(image, targettemp_string, (text_y + offset_limit_text, temp_x), self.theme.FONT_SMALL, self.theme.COLOR_TEMPERATURE)
+            slots['temperature_target'] = (targettemp_string, (text_y + offset_limit_text, temp_x), self.theme.FONT_SMALL, self.theme.COLOR_TEMPERATURE)
         
-        draw_rotated_text_centered(image, "Runtime:", (text_y + offset_title_text, time_x), self.theme.FONT_REGULAR, self.theme.COLOR_PRIMARY)
-        temp_string = '{}'.format(self.timestamps[-1] - self.timestamps[0])
-        draw_rotated_text_centered(image, temp_string, (text_y, time_x), self.theme.FONT_BIG, self.theme.COLOR_PRIMARY)
+        slots['runtime_title'] = ("Runtime:", (text_y + offset_title_text, time_x), self.theme.FONT_REGULAR, self.theme.COLOR_PRIMARY)
+        runtime_string = '{}'.format(self.runtime)
+        slots['runtime'] = (runtime_string, (text_y, time_x), self.theme.FONT_BIG, self.theme.COLOR_PRIMARY)
         if self.target_time is not None:
             targettime_string = 'ETA: {}'.format(self.target_time)
-            draw_rotated_text_centered(image, targettime_string, (text_y + offset_limit_text, time_x), self.theme.FONT_SMALL, self.theme.COLOR_PRIMARY)
+            slots['runtime_target'] = (targettime_string, (text_y + offset_limit_text, time_x), self.theme.FONT_SMALL, self.theme.COLOR_PRIMARY)
         
-        self.graph.draw(image)
+        return slots
+    
+    def text_box(self, context, slot):
+        text, position, font, _ = slot
+        size = context.textsize(text, font)
+        return bounding_box((position[0], position[1] - size[0] / 2, position[0] + size[1], position[1] + size[0] / 2))
+        
+    def draw(self, image):
+        context = image.draw()
+        self.graph.theme = self.theme
+        self.graph.set_color('left', self.theme.COLOR_HUMIDITY)
+        self.graph.set_color('right', self.theme.COLOR_TEMPERATURE)
+        
+        slots = self.text_slots()
+        boxes = {role: self.text_box(context, slot) for role, slot in slots.items()}
+        
+        if self.needs_redraw:
+            context.rectangle(self.xy, fill=self.theme.COLOR_BACKGROUND)
+            dirty = [bounding_box(self.xy)]
+            self.graph.invalidate()
+        else:
+            # only clear the texts that changed since the last paint
+            dirty = []
+            for role in set(slots) | set(self.drawn_state):
+                if slots.get(role) != self.drawn_state.get(role):
+                    old_box, new_box = self.drawn_boxes.get(role), boxes.get(role)
+                    dirty.append(union_box(old_box, new_box) if old_box and new_box else old_box or new_box)
+            for box in dirty:
+                context.rectangle((box[0], box[1], box[2] - 1, box[3] - 1), fill=self.theme.COLOR_BACKGROUND)
+        
+        graph_box = bounding_box(self.graph.outer_xy)
+        if self.graph.needs_redraw or any(intersects(box, graph_box) for box in dirty):
+            self.graph.draw(image)
+            dirty += self.graph.pop_damage()
+        
+        # restore every text that was painted over, but only inside the cleared boxes. Outside of them
+        # the text is still there and painting it again would blend its edges twice. After clearing
+        # the whole widget there is nothing left to clip
+        for role, slot in slots.items():
+            cleared = [box for box in dirty if intersects(boxes[role], box)]
+            if len(cleared) > 0:
+                text, position, font, color = slot
+                draw_rotated_text_centered(image, text, position, font, color, None if self.needs_redraw else cleared)
+        
+        self.damage += dirty
+        self.drawn_state = slots
+        self.drawn_boxes = boxes
+        self.needs_redraw = False
         
 class MenuWidget(Widget):
     def __init__(self, xy, theme):
@@ -284,51 +570,146 @@ class MenuWidget(Widget):
             if self.selected_item < self.scroll_offset:
                 self.scroll_offset -= 1
         
+    def visible_rows(self):
+        # what each visible item looks like: its texts and whether it is selected or edited
+        rows = []
+        for num, (title, _, end) in enumerate(self.menu_items[self.scroll_offset : self.scroll_offset + self.items_on_screen]):
+            selected = num + self.scroll_offset == self.selected_item
+            rows.append((title, end, selected, selected and self.edit_mode))
+        return tuple(rows)
+        
+    def row_xy(self, num):
+        return (self.xy[2] - self.item_height * (num + 1), self.xy[1], self.xy[2] - self.item_height * num, self.xy[3])
+        
     def draw(self, image):
+        state = (self.visible_rows(), self.scroll_offset)
+        if self.needs_redraw or self.drawn_state is None or state[1] != self.drawn_state[1] or len(state[0]) != len(self.drawn_state[0]):
+            # scrolling moves every row
+            self.draw_retained(image, state, self.paint)
+            return
+        
+        # only the rows whose selection or value changed are painted again
+        rows, drawn_rows = state[0], self.drawn_state[0]
+        self.drawn_state = state
+        context = image.draw()
+        for num, row in enumerate(rows):
+            if row != drawn_rows[num]:
+                context.rectangle(self.row_xy(num), fill=self.theme.COLOR_BACKGROUND)
+                self.paint_row(image, context, num)
+                self.add_damage(self.row_xy(num))
+        
+    def paint(self, image):
         context = image.draw()
         
         context.rectangle(self.xy, fill=self.theme.COLOR_BACKGROUND)
+        for num in range(len(self.menu_items[self.scroll_offset : self.scroll_offset + self.items_on_screen])):
+            self.paint_row(image, context, num)
+            
+    def paint_row(self, image, context, num):
         margin_x = 8
+        item_index = num + self.scroll_offset
+        title, icon, end = self.menu_items[item_index]
+        
+        # draw the selector for the currently selected icon
+        if item_index == self.selected_item:
+            selection_color = self.theme.COLOR_EDIT if self.edit_mode else self.theme.COLOR_SELECTION
+            context.rectangle(self.row_xy(num), fill=selection_color)
+        
+        # draw icon
+        if icon is not None:
+            icon_x, icon_y = int(self.xy[2] - self.item_height * num - self.item_height / 2 - icon.height / 2), self.xy[1] + margin_x
+            paste_image(image, icon, (icon_x, icon_y), self.theme)
+    
+        # draw title
+        title_size = context.textsize(title, font=self.theme.FONT_BIG)
+        title_x, title_y = self.xy[2] - (self.item_height * num) - self.item_height / 2 - title_size[1] / 2, self.xy[1] + icon.width + margin_x * 2
+        draw_rotated_text(image, title, (title_x, title_y), angle=-90, font=self.theme.FONT_BIG, fill=self.theme.COLOR_PRIMARY)
+    
+        # draw the end text
+        if end is not None:
+            end_size = context.textsize(end, font=self.theme.FONT_BIG)
+            title_x, title_y = self.xy[2] - (self.item_height * num) - self.item_height / 2 - end_size[1] / 2, self.xy[3] - end_size[0] - margin_x
+            draw_rotated_text(image, end, (title_x, title_y), angle=-90, font=self.theme.FONT_BIG, fill=self.theme.COLOR_PRIMARY)
+            
+class ListWidget(Widget):
+    # scrollable list of items with a title and a line of details, only the visible items are
+    # ever asked for, so the list can be long
+    def __init__(self, xy, theme):
+        super().__init__(xy, theme)
+        
+        self.item_count = 0
+        self.describe = None
+        self.selected_item = 0
+        self.scroll_offset = 0
+        
+        self.item_height = 45
+        self.items_on_screen = int(self.width / self.item_height)
+        
+    def set_items(self, count, describe):
+        # describe(index) returns the (title, details) of an item
+        self.item_count = count
+        self.describe = describe
+        self.selected_item = min(self.selected_item, max(count - 1, 0))
+        self.invalidate()
         
+    def select(self, index):
+        self.selected_item = index
+        self.scroll_offset = max(0, min(index, self.item_count - self.items_on_screen))
         
-        for num, menu_item in enumerate(self.menu_items[self.scroll_offset : self.scroll_offset + self.items_on_screen]):
-            title, icon, end = menu_item
+    def scroll_down(self):
+        if self.selected_item < self.item_count - 1:
+            self.selected_item += 1
+            if self.selected_item - self.scroll_offset >= self.items_on_screen:
+                self.scroll_offset += 1
+            
+    def scroll_up(self):
+        if self.selected_item > 0:
+            self.selected_item -= 1
+            if self.selected_item < self.scroll_offset:
+                self.scroll_offset -= 1
+        
+    def draw(self, image):
+        # the descriptions are part of the state, the same position may describe another item later
+        visible = tuple(self.describe(index) for index in range(self.scroll_offset, min(self.scroll_offset + self.items_on_screen, self.item_count)))
+        self.draw_retained(image, (visible, self.selected_item, self.scroll_offset), partial(self.paint, visible=visible))
+        
+    def paint(self, image, visible):
+        context = image.draw()
+        
+        context.rectangle(self.xy, fill=self.theme.COLOR_BACKGROUND)
+        margin_x = 8
+        line_spacing = 2
+        
+        for num, (title, details) in enumerate(visible):
             item_index = num + self.scroll_offset
             
-            # draw the selector for the currently selected icon
             if item_index == self.selected_item:
                 selection_xy = (self.xy[2] - self.item_height * (num + 1),
                                 self.xy[1],
                                 self.xy[2] - self.item_height * num,
                                 self.xy[3])
-                
-                selection_color = self.theme.COLOR_EDIT if self.edit_mode else self.theme.COLOR_SELECTION
-                context.rectangle(selection_xy, fill=selection_color)
+                context.rectangle(selection_xy, fill=self.theme.COLOR_SELECTION)
             
-            # draw icon
-            if icon is not None:
-                icon_x, icon_y = int(self.xy[2] - self.item_height * num - self.item_height / 2 - icon.height / 2), self.xy[1] + margin_x
-                paste_image(image, icon, (icon_x, icon_y), self.theme)
-        
-            # draw title
+            # the title above the details, both centered in the item
             title_size = context.textsize(title, font=self.theme.FONT_BIG)
-            title_x, title_y = self.xy[2] - (self.item_height * num) - self.item_height / 2 - title_size[1] / 2, self.xy[1] + icon.width + margin_x * 2
-            draw_rotated_text(image, title, (title_x, title_y), angle=-90, font=self.theme.FONT_BIG, fill=self.theme.COLOR_PRIMARY)
-        
-            # draw the end text
-            if end is not None:
-                end_size = context.textsize(end, font=self.theme.FONT_BIG)
-                title_x, title_y = self.xy[2] - (self.item_height * num) - self.item_height / 2 - end_size[1] / 2, self.xy[3] - end_size[0] - margin_x
-                draw_rotated_text(image, end, (title_x, title_y), angle=-90, font=self.theme.FONT_BIG, fill=self.theme.COLOR_PRIMARY)
+            details_size = context.textsize(details, font=self.theme.FONT_SMALL) if details else (0, 0)
+            text_height = title_size[1] + line_spacing + details_size[1]
+            title_x = self.xy[2] - (self.item_height * num) - self.item_height / 2 + text_height / 2 - title_size[1]
+            draw_rotated_text(image, title, (title_x, self.xy[1] + margin_x), angle=-90, font=self.theme.FONT_BIG, fill=self.theme.COLOR_PRIMARY)
+            if details:
+                draw_rotated_text(image, details, (title_x - line_spacing - details_size[1], self.xy[1] + margin_x), angle=-90, font=self.theme.FONT_SMALL, fill=self.theme.COLOR_PRIMARY)
             
 class StartWidget(Widget):
     def __init__(self, xy, theme):
         super().__init__(xy, theme)
         
-        self.logo = Image.open('resources/icons/logo.png').rotate(-90).convert('RGBA')
+        self.logo = load_image('resources/icons/logo.png', theme)
         self.start_icon = load_image('resources/icons/start_small.png', theme)
                 
     def draw(self, image):
+        self.draw_retained(image, (), self.paint)
+        
+    def paint(self, image):
         context = image.draw()
         
         context.rectangle(self.xy, fill=self.theme.COLOR_BACKGROUND)
@@ -376,53 +757,58 @@ class Dialog(Widget):
         self.selected_button = 'left' if self.selected_button == 'right' else 'right'
         
     def draw(self, image):
+        # not retained as a whole, a title like the waiting countdown changes every second and would push
+        # a new dialog sized layer into the cache each time. Only the frame and the buttons are kept by
+        # paint, the texts are drawn over them
+        if not self.is_outdated((self.title, self.buttons['left'], self.buttons['right'], self.selected_button)):
+            return
+        self.paint(image)
+        self.add_damage(self.xy)
+
+    def paint(self, image):
         context = image.draw()
         
-        context.rectangle(self.xy, fill=self.theme.COLOR_BACKGROUND, outline=self.theme.COLOR_PRIMARY)
-        
         dialog_margin = 30
         selection_size = 100, 26
         button_distance = 60
         title_font = self.theme.FONT_BIG
         button_font = self.theme.FONT_REGULAR_BOLD
         
-        # draw the title
-        title_size = context.textsize(self.title, title_font)
-        draw_rotated_text_centered(image, self.title, (self.xy[2] - self.xy[0] - dialog_margin, self.xy[1] + self.height / 2), title_font, self.theme.COLOR_PRIMARY)
-        
-        # draw the left button
+        # the left button is centered unless there is a right one
         button_l_text_size = context.textsize(self.buttons['left'], button_font)
-        # by default the button is centered
         button_l_x = self.xy[0] + dialog_margin + button_l_text_size[1]
         button_l_y = self.xy[1] + self.height / 2
         button_center_x = button_l_x + button_l_text_size[1] / 2
-        
-        # move button to left if another button is defined
         if self.buttons['right'] is not None:
             button_l_y -= button_distance
-            
+        button_boxes = {'left': (button_center_x - selection_size[1] / 2,
+                                 button_l_y - selection_size[0] / 2, 
+                                 button_center_x + selection_size[1] / 2,
+                                 button_l_y + selection_size[0] / 2)}
+        if self.buttons['right'] is not None:
+            button_r_y = self.xy[1] + self.height / 2 + button_distance
+            button_boxes['right'] = (button_center_x - selection_size[1] / 2,
+                                     button_r_y - selection_size[0] / 2, 
+                                     button_center_x + selection_size[1] / 2,
+                                     button_r_y + selection_size[0] / 2)
         
-        btnl_fill = self.theme.COLOR_SELECTION if self.selected_button == 'left' else self.theme.COLOR_BACKGROUND
-        buttonl_selection = (button_center_x - selection_size[1] / 2,
-                             button_l_y - selection_size[0] / 2, 
-                             button_center_x + selection_size[1] / 2,
-                             button_l_y + selection_size[0] / 2)
-        context.rectangle(buttonl_selection, fill=btnl_fill, outline=self.theme.COLOR_PRIMARY)
-            
-        draw_rotated_text_centered(image, self.buttons['left'], (button_l_x, button_l_y), button_font, self.theme.COLOR_PRIMARY)
+        # the frame and the empty buttons only depend on where the buttons are
+        geometry = tuple(sorted(button_boxes.items()))
+        self.draw_background(image, self.xy, partial(self.paint_background, button_boxes=button_boxes), geometry)
+        context.rectangle(button_boxes[self.selected_button], fill=self.theme.COLOR_SELECTION, outline=self.theme.COLOR_PRIMARY)
         
-        # draw the right button
+        # draw the title
+        draw_rotated_text_centered(image, self.title, (self.xy[2] - self.xy[0] - dialog_margin, self.xy[1] + self.height / 2), title_font, self.theme.COLOR_PRIMARY)
+        
+        # draw the button texts
+        draw_rotated_text_centered(image, self.buttons['left'], (button_l_x, button_l_y), button_font, self.theme.COLOR_PRIMARY)
         if self.buttons['right'] is not None:
             button_r_text_size = context.textsize(self.buttons['right'], button_font)
-            # by default the button is centered
             button_r_x = self.xy[0] + dialog_margin + button_r_text_size[1]
-            button_r_y = self.xy[1] + self.height / 2 + button_distance
-                
-            btnr_fill = self.theme.COLOR_SELECTION if self.selected_button == 'right' else self.theme.COLOR_BACKGROUND
-            buttonr_selection = (button_center_x - selection_size[1] / 2,
-                                button_r_y - selection_size[0] / 2, 
-                                button_center_x + selection_size[1] / 2,
-                                button_r_y + selection_size[0] / 2)
-            context.rectangle(buttonr_selection, fill=btnr_fill, outline=self.theme.COLOR_PRIMARY)
-                
-            draw_rotated_text_centered(image, self.buttons['right'], (button_r_x, button_r_y), button_font, self.theme.COLOR_PRIMARY)
\ No newline at end of file
+            draw_rotated_text_centered(image, self.buttons['right'], (button_r_x, button_r_y), button_font, self.theme.COLOR_PRIMARY)
+            
+    def paint_background(self, image, button_boxes):
+        context = image.draw()
+        context.rectangle(self.xy, fill=self.theme.COLOR_BACKGROUND, outline=self.theme.COLOR_PRIMARY)
+        for box in button_boxes.values():
+            context.rectangle(box, fill=self.theme.COLOR_BACKGROUND, outline=self.theme.COLOR_PRIMARY)
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+# watches and drives a unit through its framebuffer mirror, e.g. through an SSH tunnel to the
+# mirror_address of the app: viewer.py [host] [port]
+# The arrow keys turn the encoder, return clicks and l long clicks.
+
+import socket
+import sys
+import threading
+import zlib
+import tkinter as Tk
+
+import numpy as np
+from PIL import Image, ImageTk
+
+from lib.mirror import FrameMirror
+
+def receive(connection, size):
+    data = b''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if len(chunk) == 0:
+            raise ConnectionError('the mirror closed the connection')
+        data += chunk
+    return data
+
+def read_frames(connection, pixels, changed):
+    # applies every message of tiles to pixels as it arrives
+    while True:
+        count, = FrameMirror.MESSAGE.unpack(receive(connection, FrameMirror.MESSAGE.size))
+        for _ in range(count):
+            x, y, width, height, length = FrameMirror.TILE.unpack(receive(connection, FrameMirror.TILE.size))
+            tile = np.frombuffer(zlib.decompress(receive(connection, length)), dtype='>u2').reshape(height, width)
+            pixels[y:y + height, x:x + width] = tile
+        changed.set()
+
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 5900
+
+    connection = socket.create_connection((host, port))
+    magic, version, width, height, _ = FrameMirror.HEADER.unpack(receive(connection, FrameMirror.HEADER.size))
+    if magic != FrameMirror.MAGIC or version != FrameMirror.VERSION:
+        sys.exit('{}:{} is no framebuffer mirror of a compatible version'.format(host, port))
+
+    pixels = np.zeros((height, width), dtype='>u2')
+    changed = threading.Event()
+    threading.Thread(target=read_frames, args=(connection, pixels, changed), daemon=True).start()
+
+    root = Tk.Tk()
+    root.wm_title('Smart Dry {}:{}'.format(host, port))
+    label = Tk.Label(root)
+    label.pack()
+
+    def show():
+        if changed.is_set():
+            changed.clear()
+            # RGB565 back to RGB, turned like the mock window
+            value = pixels.astype(np.uint16)
+            rgb = np.dstack((((value >> 11) & 0x1F) << 3, ((value >> 5) & 0x3F) << 2, (value & 0x1F) << 3)).astype(np.uint8)
+            label.image = ImageTk.PhotoImage(Image.fromarray(np.rot90(rgb)))
+            label.configure(image=label.image)
+        root.after(33, show)
+
+    keys = {'Right': b'+', 'Down': b'+', 'Left': b'-', 'Up': b'-', 'Return': b'c', 'space': b'c', 'l': b'l'}
+    root.bind('<Key>', lambda event: connection.sendall(keys[event.keysym]) if event.keysym in keys else None)
+    root.after(33, show)
+    root.mainloop()
+
+if __name__ == '__main__':
+    main()